@@ -1,20 +1,73 @@
-from flask import Flask, jsonify, request
+import os
+import atexit
+import hashlib
 from datetime import datetime
+from flask import Flask, Response, jsonify, request
+import data
 from data import (
-    menu, orders, generate_uuid, get_pizza_by_id, add_pizza_to_menu,
-    delete_pizza_from_menu, create_new_order, get_order_by_id, cancel_order
+    open_storage, close_storage,
+    get_pizza_by_id, menu_snapshot, add_pizza_to_menu, delete_pizza_from_menu,
+    create_new_order, create_new_orders, get_order_by_id, find_orders, cancel_order,
+    update_order_status as set_order_status, update_order_statuses
 )
 from auth import admin_required
 
 app = Flask(__name__)
 
+VALID_STATUSES = ["pending", "preparing", "ready_for_delivery", "delivered", "cancelled"]
+
+# Page size of /admin/orders
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Seconds clients may reuse a /menu response before revalidating it
+MENU_MAX_AGE = 60
+
+# Serialized /menu response: (menu version, body, ETag). Rebuilt only when
+# an admin write has bumped data.menu_version
+menu_cache = (None, b"", "")
+
+# Most items of a batch request
+MAX_BATCH_SIZE = 500
+
+# A pizza was deleted from the menu between the check and the order creation
+MENU_CHANGED = "Some pizzas of the order are no longer on the menu."
+
 # --- Helper Function for JSON Response ---
-def success_response(data, status_code=200):
-    return jsonify({"success": True, "data": data}), status_code
+def success_response(payload, status_code=200, **extra):
+    return jsonify({"success": True, "data": payload, **extra}), status_code
 
 def error_response(message, status_code=400):
     return jsonify({"success": False, "error": message}), status_code
 
+# Results of the items of a batch request
+def item_success(payload, status_code=200):
+    return {"success": True, "status": status_code, "data": payload}
+
+def item_error(message, status_code=400):
+    return {"success": False, "status": status_code, "error": message}
+
+# Check the items of an order and add the pizza details to them. Returns
+# (items, None), or (None, (error message, status code))
+def check_order_items(items):
+    if not isinstance(items, list) or not all(isinstance(item, dict) and 'pizza_id' in item and 'quantity' in item for item in items):
+        return None, ("Invalid 'items' format. Expected a list of objects with 'pizza_id' and 'quantity'.", 400)
+
+    order_items_with_details = []
+    for item in items:
+        pizza = get_pizza_by_id(item['pizza_id'])
+        if not pizza:
+            return None, (f"Pizza with ID '{item['pizza_id']}' not found.", 404)
+        if not isinstance(item['quantity'], int) or item['quantity'] <= 0:
+            return None, (f"Invalid quantity for pizza ID '{item['pizza_id']}'. Quantity must be a positive integer.", 400)
+        order_items_with_details.append({
+            "pizza_id": pizza['pizza_id'],
+            "name": pizza['name'],
+            "price": pizza['price'],
+            "quantity": item['quantity']
+        })
+    return order_items_with_details, None
+
 # --- Customer API Endpoints ---
 
 @app.route('/menu', methods=['GET'])
@@ -22,8 +75,23 @@ def list_menu():
     """
     List the available pizzas on the menu.
     GET /menu
+    The response is served from a cache and carries an ETag: a request with
+    a matching If-None-Match header gets 304 Not Modified.
     """
-    return success_response(list(menu.values()))
+    global menu_cache
+    version, body, etag = menu_cache
+    if version != data.menu_version:
+        version, pizzas = menu_snapshot()
+        body = (app.json.dumps({"success": True, "data": pizzas}) + "\n").encode()
+        # Hash of the content rather than the version, which restarts at 0
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        menu_cache = (version, body, etag)
+
+    headers = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={MENU_MAX_AGE}"}
+    # If-None-Match uses the weak comparison (RFC 9110)
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
 
 @app.route('/order', methods=['POST'])
 def create_order():
@@ -38,36 +106,59 @@ def create_order():
         ]
     }
     """
-    data = request.get_json()
-    if not data or 'items' not in data:
+    body = request.get_json()
+    if not body or 'items' not in body:
         return error_response("Missing 'items' in request body", 400)
 
-    items = data['items']
-    if not isinstance(items, list) or not all(isinstance(item, dict) and 'pizza_id' in item and 'quantity' in item for item in items):
-        return error_response("Invalid 'items' format. Expected a list of objects with 'pizza_id' and 'quantity'.", 400)
+    order_items_with_details, error = check_order_items(body['items'])
+    if error:
+        return error_response(*error)
 
-    order_items_with_details = []
-    for item in items:
-        pizza = get_pizza_by_id(item['pizza_id'])
-        if not pizza:
-            return error_response(f"Pizza with ID '{item['pizza_id']}' not found.", 404)
-        if not isinstance(item['quantity'], int) or item['quantity'] <= 0:
-            return error_response(f"Invalid quantity for pizza ID '{item['pizza_id']}'. Quantity must be a positive integer.", 400)
-        order_items_with_details.append({
-            "pizza_id": pizza['pizza_id'],
-            "name": pizza['name'],
-            "price": pizza['price'],
-            "quantity": item['quantity']
-        })
+    order = create_new_order(order_items_with_details)
+    if not order:
+        return error_response(MENU_CHANGED, 409)
+    return success_response(order, 201)
 
-    order_id = generate_uuid()
-    orders[order_id] = {
-        "order_id": order_id,
-        "items": order_items_with_details,
-        "status": "pending",
-        "timestamp": datetime.now().isoformat()
+@app.route('/orders/batch', methods=['POST'])
+def create_orders_batch():
+    """
+    Create many orders at once.
+    POST /orders/batch
+    Request Body:
+    {
+        "orders": [
+            {"items": [{"pizza_id": "pizza1", "quantity": 1}]},
+            {"items": [{"pizza_id": "pizza2", "quantity": 2}]}
+        ]
     }
-    return success_response(orders[order_id], 201)
+    Every order is checked on its own: 'data' has one result per order, in
+    the same order, like the response of POST /order plus its 'status' code.
+    """
+    body = request.get_json()
+    if not isinstance(body, dict) or not isinstance(body.get('orders'), list) or not body['orders']:
+        return error_response("Missing 'orders' in request body. Expected a non-empty list.", 400)
+    if len(body['orders']) > MAX_BATCH_SIZE:
+        return error_response(f"Too many orders. At most {MAX_BATCH_SIZE} per request.", 400)
+
+    results, valid = [], []
+    for entry in body['orders']:
+        if not isinstance(entry, dict) or 'items' not in entry:
+            results.append(item_error("Missing 'items' in order", 400))
+            continue
+        order_items_with_details, error = check_order_items(entry['items'])
+        if error:
+            results.append(item_error(*error))
+            continue
+        results.append(None)
+        valid.append(order_items_with_details)
+
+    # The valid orders are created together, waiting once for the disk
+    created = iter(create_new_orders(valid))
+    for position, result in enumerate(results):
+        if result is None:
+            order = next(created)
+            results[position] = item_success(order, 201) if order else item_error(MENU_CHANGED, 409)
+    return success_response(results)
 
 @app.route('/order/<order_id>', methods=['GET'])
 def check_order_status(order_id):
@@ -86,16 +177,15 @@ def cancel_customer_order(order_id):
     Cancel an order if its status is not 'ready_for_delivery' or 'delivered'.
     DELETE /order/{order_id}
     """
-    order = get_order_by_id(order_id)
+    # The status is checked and the order removed under the same lock
+    cancelled, order = cancel_order(order_id, keep_statuses=["ready_for_delivery", "delivered"])
     if not order:
         return error_response(f"Order with ID '{order_id}' not found.", 404)
 
-    if order['status'] in ["ready_for_delivery", "delivered"]:
+    if not cancelled:
         return error_response(f"Order cannot be cancelled. Status is '{order['status']}'.", 403)
 
-    if cancel_order(order_id):
-        return success_response({"message": f"Order with ID '{order_id}' cancelled successfully."})
-    return error_response("Failed to cancel order.", 500) # Should not happen with current logic
+    return success_response({"message": f"Order with ID '{order_id}' cancelled successfully."})
 
 
 # --- Admin API Endpoints ---
@@ -114,13 +204,13 @@ def add_pizza():
     }
     Requires X-Admin-Token header.
     """
-    data = request.get_json()
-    if not data or not all(k in data for k in ['name', 'description', 'price']):
+    body = request.get_json()
+    if not body or not all(k in body for k in ['name', 'description', 'price']):
         return error_response("Missing required fields: 'name', 'description', 'price'", 400)
 
-    name = data['name']
-    description = data['description']
-    price = data['price']
+    name = body['name']
+    description = body['description']
+    price = body['price']
 
     if not isinstance(name, str) or not name.strip():
         return error_response("Invalid 'name'. Must be a non-empty string.", 400)
@@ -152,23 +242,46 @@ def cancel_admin_order(order_id):
     DELETE /admin/order/{order_id}
     Requires X-Admin-Token header.
     """
-    order = get_order_by_id(order_id)
-    if not order:
+    cancelled, order = cancel_order(order_id)
+    if not cancelled:
         return error_response(f"Order with ID '{order_id}' not found.", 404)
 
-    if cancel_order(order_id):
-        return success_response({"message": f"Order with ID '{order_id}' cancelled by admin."})
-    return error_response("Failed to cancel order.", 500) # Should not happen with current logic
+    return success_response({"message": f"Order with ID '{order_id}' cancelled by admin."})
 
 @app.route('/admin/orders', methods=['GET'])
 @admin_required
 def list_all_orders():
     """
-    List all orders (Admin only).
-    GET /admin/orders
+    List orders, oldest first, one page at a time (Admin only).
+    GET /admin/orders?status=preparing&since=2025-05-20T18:00:00&until=2025-05-20T20:00:00&limit=100&cursor=<next_cursor>
+    All parameters are optional. 'since' and 'until' filter by creation time
+    (ISO 8601, local time unless an offset is given). The response has a
+    'next_cursor' to pass as 'cursor' for the next page, null on the last one.
     Requires X-Admin-Token header.
     """
-    return success_response(list(orders.values()))
+    status = request.args.get('status')
+    if status is not None and status not in VALID_STATUSES:
+        return error_response(f"Invalid status. Allowed statuses: {', '.join(VALID_STATUSES)}", 400)
+
+    times = {}
+    for name in ['since', 'until']:
+        value = request.args.get(name)
+        if value is not None:
+            try:
+                times[name] = datetime.fromisoformat(value)
+            except ValueError:
+                return error_response(f"Invalid '{name}'. Expected an ISO 8601 date and time.", 400)
+
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return error_response(f"Invalid 'limit'. Must be an integer between 1 and {MAX_PAGE_SIZE}.", 400)
+
+    page, next_cursor = find_orders(status, times.get('since'), times.get('until'),
+                                    request.args.get('cursor'), limit)
+    return success_response(page, next_cursor=next_cursor)
 
 @app.route('/admin/order/<order_id>/status', methods=['PUT'])
 @admin_required
@@ -182,22 +295,69 @@ def update_order_status(order_id):
     }
     Requires X-Admin-Token header.
     """
-    data = request.get_json()
-    if not data or 'status' not in data:
+    body = request.get_json()
+    if not body or 'status' not in body:
         return error_response("Missing 'status' in request body.", 400)
 
-    new_status = data['status']
-    valid_statuses = ["pending", "preparing", "ready_for_delivery", "delivered", "cancelled"]
-    if new_status not in valid_statuses:
-        return error_response(f"Invalid status. Allowed statuses: {', '.join(valid_statuses)}", 400)
+    new_status = body['status']
+    if new_status not in VALID_STATUSES:
+        return error_response(f"Invalid status. Allowed statuses: {', '.join(VALID_STATUSES)}", 400)
 
-    order = get_order_by_id(order_id)
+    order = set_order_status(order_id, new_status)
     if not order:
         return error_response(f"Order with ID '{order_id}' not found.", 404)
 
-    order['status'] = new_status
     return success_response(order)
 
+@app.route('/admin/orders/status', methods=['PATCH'])
+@admin_required
+def update_order_statuses_batch():
+    """
+    Update the status of many orders at once (Admin only).
+    PATCH /admin/orders/status
+    Request Body:
+    {
+        "updates": [
+            {"order_id": "01JV...", "status": "ready_for_delivery"},
+            {"order_id": "01JW...", "status": "ready_for_delivery"}
+        ]
+    }
+    Updates are applied in the given order. 'data' has one result per
+    update, like the response of PUT /admin/order/{order_id}/status plus its
+    'status' code.
+    Requires X-Admin-Token header.
+    """
+    body = request.get_json()
+    if not isinstance(body, dict) or not isinstance(body.get('updates'), list) or not body['updates']:
+        return error_response("Missing 'updates' in request body. Expected a non-empty list.", 400)
+    if len(body['updates']) > MAX_BATCH_SIZE:
+        return error_response(f"Too many updates. At most {MAX_BATCH_SIZE} per request.", 400)
+
+    results, valid = [], []
+    for update in body['updates']:
+        if not isinstance(update, dict) or 'order_id' not in update or 'status' not in update:
+            results.append(item_error("Missing 'order_id' or 'status' in update.", 400))
+        elif update['status'] not in VALID_STATUSES:
+            results.append(item_error(f"Invalid status. Allowed statuses: {', '.join(VALID_STATUSES)}", 400))
+        else:
+            results.append(None)
+            valid.append((str(update['order_id']), update['status']))
+
+    # The shards of the store are locked once for the whole batch
+    updated = iter(zip(valid, update_order_statuses(valid)))
+    for position, result in enumerate(results):
+        if result is None:
+            (order_id, _), order = next(updated)
+            results[position] = item_success(order) if order else item_error(f"Order with ID '{order_id}' not found.", 404)
+    return success_response(results)
+
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # With PIZZA_DATA_DIR set, orders and menu changes are saved there
+    data_dir = os.environ.get("PIZZA_DATA_DIR")
+    if data_dir:
+        replayed = open_storage(data_dir)
+        print(f"Data loaded from {data_dir} ({replayed} log record(s) replayed)")
+        atexit.register(close_storage)
+    # The reloader would run a second process on the same data directory
+    app.run(debug=True, port=5000, use_reloader=not data_dir)
\ No newline at end of file
@@ -1,9 +1,16 @@
-import uuid
+import os
+import time
+import threading
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from itertools import islice
+from datetime import datetime
+import persistence
 
 # --- Data Structures ---
 # Pizza:
 # {
-#   "pizza_id": "uuid",
+#   "pizza_id": "ulid",
 #   "name": "string",
 #   "description": "string",
 #   "price": float
@@ -11,9 +18,9 @@ import uuid
 
 # Order:
 # {
-#   "order_id": "uuid",
+#   "order_id": "ulid",
 #   "items": [
-#       {"pizza_id": "uuid", "quantity": int}
+#       {"pizza_id": "ulid", "quantity": int}
 #   ],
 #   "status": "pending" | "preparing" | "ready_for_delivery" | "delivered" | "cancelled",
 #   "timestamp": "datetime_string"
@@ -32,55 +39,422 @@ menu = {
     "pizza3": {"pizza_id": "pizza3", "name": "Veggie Delight", "description": "Mushrooms, onions, peppers, olives", "price": 11.00},
 }
 
-orders = {} # Stores order_id -> order_details
+menu_lock = threading.Lock() # Held by the menu writes
+menu_version = 0 # Bumped by every menu write, so readers can tell their copy is stale
+
+# Write-ahead log (persistence.WriteAheadLog) once open_storage() is called;
+# without it everything stays in memory
+wal = None
+
+# Log changes while holding the lock they were made under. Returns the
+# sequence number to wait for (0 without a log)
+def log_changes(records):
+    return wal.append_many(records) if wal and records else 0
+
+# Wait until a logged change is on disk. Called after releasing the lock,
+# so concurrent changes share the same disk flush
+def wait_durable(sequence):
+    if sequence:
+        wal.wait(sequence)
+
+# --- Order Store ---
+# Orders are spread over shards by ID, each with its own lock, so requests
+# on different orders don't wait for one global lock. Every operation locks
+# a single shard; only listing the orders visits them all, one at a time.
+# Callers get dict copies, never the stored records.
+# Every shard also keeps its order IDs sorted, all of them and per status.
+# IDs are ULIDs, so that is creation order too: a page of orders with a
+# given status or time range is read from the indexes, without looking at
+# the other orders.
+
+ORDER_SHARDS = 64
+
+# Stale index entries tolerated before an index is compacted
+COMPACT_MIN = 1024
+
+class Order:
+    # Fixed attributes instead of a per-order dict
+    __slots__ = ("order_id", "items", "status", "timestamp")
+
+    def __init__(self, order_id, items, status, timestamp):
+        self.order_id = order_id
+        self.items = items
+        self.status = status
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_dict(cls, order):
+        return cls(order["order_id"], order["items"], order["status"], order["timestamp"])
+
+    def to_dict(self):
+        return {
+            "order_id": self.order_id,
+            "items": self.items,
+            "status": self.status,
+            "timestamp": self.timestamp
+        }
+
+class SortedIndex:
+    # Sorted list of order IDs. Removing one only counts it as stale: the
+    # entry stays until the list is compacted and readers skip it
+    __slots__ = ("keys", "stale")
+
+    def __init__(self):
+        self.keys = []
+        self.stale = 0
+
+    def add(self, key):
+        keys = self.keys
+        # New IDs are the highest ones: appended
+        if not keys or keys[-1] < key:
+            keys.append(key)
+            return
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            self.stale -= 1 # A stale entry that is valid again
+        else:
+            keys.insert(position, key)
+
+    def discard(self, is_live):
+        self.stale += 1
+        if self.stale > COMPACT_MIN and self.stale * 2 > len(self.keys):
+            self.keys = [key for key in self.keys if is_live(key)]
+            self.stale = 0
+
+class Shard:
+    __slots__ = ("orders", "lock", "by_time", "by_status")
+
+    def __init__(self):
+        self.orders = {}
+        self.lock = threading.Lock()
+        self.by_time = SortedIndex()
+        self.by_status = {}
+
+    # Index checks: whether an index entry still stands for an order
+    def has(self, order_id):
+        return order_id in self.orders
+
+    def has_status(self, status):
+        return lambda order_id: order_id in self.orders and self.orders[order_id].status == status
+
+    # The methods below are called with the lock held
+    def put(self, order):
+        if order.order_id in self.orders:
+            self.remove(order.order_id)
+        self.orders[order.order_id] = order
+        self.by_time.add(order.order_id)
+        self.by_status.setdefault(order.status, SortedIndex()).add(order.order_id)
+
+    def set_status(self, order, new_status):
+        if order.status == new_status:
+            return
+        old_status, order.status = order.status, new_status
+        self.by_status[old_status].discard(self.has_status(old_status))
+        self.by_status.setdefault(new_status, SortedIndex()).add(order.order_id)
+
+    def remove(self, order_id):
+        order = self.orders.pop(order_id)
+        self.by_time.discard(self.has)
+        self.by_status[order.status].discard(self.has_status(order.status))
+        return order
+
+    # Up to limit IDs in (after, ...] and [lower, upper], in order, of the
+    # orders with this status (any if None)
+    def scan(self, status, after, lower, upper, limit):
+        index = self.by_time if status is None else self.by_status.get(status)
+        if index is None:
+            return []
+        is_live = self.has if status is None else self.has_status(status)
+        keys = index.keys
+        position = 0
+        if after is not None:
+            position = bisect_right(keys, after)
+        if lower is not None:
+            position = max(position, bisect_left(keys, lower))
+        found = []
+        while position < len(keys) and len(found) < limit:
+            key = keys[position]
+            if upper is not None and key > upper:
+                break
+            if is_live(key):
+                found.append(key)
+            position += 1
+        return found
+
+class OrderStore:
+    def __init__(self, shards=ORDER_SHARDS):
+        self.shards = [Shard() for _ in range(shards)]
+
+    def _shard(self, order_id):
+        return self.shards[hash(order_id) % len(self.shards)]
+
+    # Positions of the order IDs grouped by shard, so a batch locks every
+    # shard it touches once
+    def _group(self, order_ids):
+        groups = {}
+        for position, order_id in enumerate(order_ids):
+            groups.setdefault(hash(order_id) % len(self.shards), []).append(position)
+        return groups.items()
+
+    # Create orders from (items, timestamp) pairs. All of them are on disk
+    # when it returns, after a single wait
+    def add_many(self, entries):
+        new_orders = [Order(generate_uuid(), items, "pending", timestamp) for items, timestamp in entries]
+        results = [None] * len(new_orders)
+        sequence = 0
+        for index, positions in self._group([order.order_id for order in new_orders]):
+            shard = self.shards[index]
+            with shard.lock:
+                records = []
+                for position in positions:
+                    shard.put(new_orders[position])
+                    results[position] = new_orders[position].to_dict()
+                    records.append({"op": "order", "order": results[position]})
+                sequence = max(sequence, log_changes(records))
+        wait_durable(sequence)
+        return results
+
+    def add(self, items, timestamp):
+        return self.add_many([(items, timestamp)])[0]
+
+    def get(self, order_id):
+        shard = self._shard(order_id)
+        with shard.lock:
+            order = shard.orders.get(order_id)
+            return order.to_dict() if order else None
+
+    # Apply (order_id, new_status) updates in the given order. Returns the
+    # updated orders, None for the ones that don't exist
+    def set_status_many(self, updates):
+        results = [None] * len(updates)
+        sequence = 0
+        for index, positions in self._group([order_id for order_id, _ in updates]):
+            shard = self.shards[index]
+            with shard.lock:
+                records = []
+                for position in positions:
+                    order_id, new_status = updates[position]
+                    order = shard.orders.get(order_id)
+                    if not order:
+                        continue
+                    shard.set_status(order, new_status)
+                    results[position] = order.to_dict()
+                    records.append({"op": "status", "order_id": order_id, "status": new_status})
+                sequence = max(sequence, log_changes(records))
+        wait_durable(sequence)
+        return results
+
+    def set_status(self, order_id, new_status):
+        return self.set_status_many([(order_id, new_status)])[0]
+
+    # Remove an order unless its status is in keep_statuses, checked under
+    # the same lock. Returns (removed, order as it was), order None if it
+    # doesn't exist
+    def remove(self, order_id, keep_statuses=()):
+        shard = self._shard(order_id)
+        with shard.lock:
+            order = shard.orders.get(order_id)
+            if not order:
+                return False, None
+            if order.status in keep_statuses:
+                return False, order.to_dict()
+            shard.remove(order_id)
+            sequence = log_changes([{"op": "cancel", "order_id": order_id}])
+        wait_durable(sequence)
+        return True, order.to_dict()
+
+    # Replay a logged change, without logging it again
+    def apply(self, record):
+        order_id = record["order"]["order_id"] if record["op"] == "order" else record["order_id"]
+        shard = self._shard(order_id)
+        with shard.lock:
+            if record["op"] == "order":
+                shard.put(Order.from_dict(record["order"]))
+            elif record["op"] == "status" and order_id in shard.orders:
+                shard.set_status(shard.orders[order_id], record["status"])
+            elif record["op"] == "cancel" and order_id in shard.orders:
+                shard.remove(order_id)
+
+    # One page of orders, oldest first: the ones with this status (any if
+    # None) and IDs after the cursor `after` and within [lower, upper].
+    # Returns (orders, cursor of the next page or None). Every shard gives
+    # at most limit + 1 IDs, so the cost depends on the page size, not on
+    # the number of orders
+    def find(self, status=None, after=None, lower=None, upper=None, limit=100):
+        found = []
+        for shard in self.shards:
+            with shard.lock:
+                found.append(shard.scan(status, after, lower, upper, limit + 1))
+        page_ids = list(islice(merge(*found), limit + 1))
+        next_cursor = page_ids[limit - 1] if len(page_ids) > limit else None
+        page = []
+        for order_id in page_ids[:limit]:
+            order = self.get(order_id)
+            # Skip an order changed since its shard was scanned
+            if order and (status is None or order["status"] == status):
+                page.append(order)
+        return page, next_cursor
+
+    def values(self):
+        result = []
+        for shard in self.shards:
+            with shard.lock:
+                result.extend(order.to_dict() for order in shard.orders.values())
+        return result
+
+    def __len__(self):
+        return sum(len(shard.orders) for shard in self.shards)
+
+orders = OrderStore() # Stores order_id -> Order
+
+# --- IDs ---
+# ULIDs: 48 bits of milliseconds and 80 random bits in 26 Crockford base32
+# characters. They sort by creation time and don't collide; within the
+# same millisecond the random part is incremented, so they stay ordered.
+
+CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+id_lock = threading.Lock()
+last_id = [0, 0] # [milliseconds, random part] of the last ID
 
 def generate_uuid():
-    return str(uuid.uuid4())[:6]
+    with id_lock:
+        millis = time.time_ns() // 1000000
+        if millis <= last_id[0]:
+            millis, random_part = last_id[0], last_id[1] + 1
+            if random_part >> 80:
+                millis, random_part = millis + 1, 0
+        else:
+            random_part = int.from_bytes(os.urandom(10), "big")
+        last_id[:] = [millis, random_part]
+    return encode_ulid(millis << 80 | random_part)
+
+def encode_ulid(value):
+    return "".join(CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+# Lowest or highest ID an order created at this Unix time (seconds) can
+# have, to look up a time range in the indexes
+def id_bound(seconds, highest=False):
+    return encode_ulid(int(seconds * 1000) << 80 | ((1 << 80) - 1 if highest else 0))
 
 def get_pizza_by_id(pizza_id):
     return menu.get(pizza_id)
 
+def list_menu_items():
+    return list(menu.values())
+
+# (version, pizzas) read together, for a cache of the menu
+def menu_snapshot():
+    with menu_lock:
+        return menu_version, list(menu.values())
+
+# Called with menu_lock held
+def bump_menu_version():
+    global menu_version
+    menu_version += 1
+
 def add_pizza_to_menu(name, description, price):
     pizza_id = generate_uuid()
-    menu[pizza_id] = {
+    pizza = {
         "pizza_id": pizza_id,
         "name": name,
         "description": description,
         "price": price
     }
-    return menu[pizza_id]
+    with menu_lock:
+        menu[pizza_id] = pizza
+        bump_menu_version()
+        sequence = log_changes([{"op": "pizza", "pizza": pizza}])
+    wait_durable(sequence)
+    return pizza
 
 def delete_pizza_from_menu(pizza_id):
-    if pizza_id in menu:
-        del menu[pizza_id]
-        return True
-    return False
+    with menu_lock:
+        if menu.pop(pizza_id, None) is None:
+            return False
+        bump_menu_version()
+        sequence = log_changes([{"op": "delete_pizza", "pizza_id": pizza_id}])
+    wait_durable(sequence)
+    return True
 
-def create_new_order(items):
-    order_id = generate_uuid()
+def create_new_order(items, timestamp=None):
     # Basic validation for pizza_ids
     for item in items:
         if not get_pizza_by_id(item['pizza_id']):
             return None # Invalid pizza ID
-    orders[order_id] = {
-        "order_id": order_id,
-        "items": items,
-        "status": "pending",
-        "timestamp": "2025-05-20T18:30:00Z" # Placeholder, use actual datetime in app.py
-    }
-    return orders[order_id]
+    return orders.add(items, timestamp or datetime.now().isoformat())
+
+# Create many orders at once: a list with the new order, or None when a
+# pizza isn't on the menu, for every list of items
+def create_new_orders(items_lists):
+    timestamp = datetime.now().isoformat()
+    valid = [all(get_pizza_by_id(item['pizza_id']) for item in items) for items in items_lists]
+    created = iter(orders.add_many([(items, timestamp) for items, ok in zip(items_lists, valid) if ok]))
+    return [next(created) if ok else None for ok in valid]
 
 def get_order_by_id(order_id):
     return orders.get(order_id)
 
+def list_orders():
+    return orders.values()
+
+# One page of orders, oldest first, filtered by status and creation time
+# (datetimes, naive ones in local time like the order timestamps). Returns
+# (orders, next_cursor): next_cursor, given as `cursor`, returns the next
+# page and is None on the last one
+def find_orders(status=None, since=None, until=None, cursor=None, limit=100):
+    lower = id_bound(since.timestamp()) if since else None
+    upper = id_bound(until.timestamp(), highest=True) if until else None
+    return orders.find(status, cursor, lower, upper, limit)
+
 def update_order_status(order_id, new_status):
-    if order_id in orders:
-        orders[order_id]['status'] = new_status
-        return True
-    return False
-
-def cancel_order(order_id):
-    if order_id in orders:
-        del orders[order_id]
-        return True
-    return False
\ No newline at end of file
+    return orders.set_status(order_id, new_status)
+
+# Apply many (order_id, new_status) updates; see OrderStore.set_status_many
+def update_order_statuses(updates):
+    return orders.set_status_many(updates)
+
+# Returns (cancelled, order); see OrderStore.remove
+def cancel_order(order_id, keep_statuses=()):
+    return orders.remove(order_id, keep_statuses)
+
+# --- Persistence ---
+
+def apply_change(record):
+    if record["op"] == "pizza":
+        with menu_lock:
+            menu[record["pizza"]["pizza_id"]] = record["pizza"]
+            bump_menu_version()
+    elif record["op"] == "delete_pizza":
+        with menu_lock:
+            menu.pop(record["pizza_id"], None)
+            bump_menu_version()
+    else:
+        orders.apply(record)
+
+def load_snapshot(state):
+    with menu_lock:
+        menu.clear()
+        menu.update((pizza["pizza_id"], pizza) for pizza in state["menu"])
+        bump_menu_version()
+    for order in state["orders"]:
+        orders.apply({"op": "order", "order": order})
+
+def snapshot_state():
+    with menu_lock:
+        pizzas = list(menu.values())
+    return {"menu": pizzas, "orders": orders.values()}
+
+# Load the menu and orders saved in directory, then log every change to
+# it. Returns the number of log records replayed. Without a snapshot yet,
+# the log applies to the default menu above
+def open_storage(directory, snapshot_every=persistence.SNAPSHOT_EVERY, fsync=True):
+    global wal
+    replayed, segment = persistence.recover(directory, load_snapshot, apply_change)
+    wal = persistence.WriteAheadLog(directory, segment, snapshot_state, snapshot_every, fsync)
+    return replayed
+
+def close_storage():
+    global wal
+    if wal:
+        wal.close()
+        wal = None
@@ -0,0 +1,175 @@
+# Durable storage for data.py: a write-ahead log of JSON records plus
+# periodic snapshots, kept in one directory:
+#   wal-<n>.log     log segments, one record per line
+#   snapshot.json   the whole state, and the first segment not included in it
+# Records are appended by the request threads and written by a single
+# writer thread, which fsyncs whatever has queued up since its last fsync
+# (group commit): many concurrent writes share one disk flush. Every
+# SNAPSHOT_EVERY records the log moves to a new segment and a snapshot is
+# written in the background, after which older segments are deleted, so
+# recovery reads one snapshot and a short tail of log.
+# The directory must be used by a single process.
+
+import os
+import re
+import json
+import threading
+
+SNAPSHOT_EVERY = 100000
+
+SNAPSHOT_FILE = "snapshot.json"
+SEGMENT_PATTERN = re.compile(r"^wal-(\d+)\.log$")
+
+def segment_path(directory, number):
+    return os.path.join(directory, f"wal-{number:08d}.log")
+
+def list_segments(directory):
+    numbers = []
+    for name in os.listdir(directory):
+        match = SEGMENT_PATTERN.match(name)
+        if match:
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+def fsync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# Load the snapshot with load_snapshot(state) and replay the log after it
+# with apply(record). Returns the number of records replayed and the next
+# segment number. A torn last line (the process died mid-write) is ignored
+def recover(directory, load_snapshot, apply):
+    os.makedirs(directory, exist_ok=True)
+    first = 0
+    path = os.path.join(directory, SNAPSHOT_FILE)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            state = json.load(f)
+        first = state["segment"]
+        load_snapshot(state)
+    replayed = 0
+    segments = [number for number in list_segments(directory) if number >= first]
+    for number in segments:
+        with open(segment_path(directory, number), "r") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                apply(json.loads(line))
+                replayed += 1
+    return replayed, max(segments + [first - 1]) + 1
+
+class WriteAheadLog:
+    # snapshot_state() must return the whole state as a JSON-able dict; it
+    # is called from a background thread
+    def __init__(self, directory, segment, snapshot_state, snapshot_every=SNAPSHOT_EVERY, fsync=True):
+        self.directory = directory
+        self.snapshot_state = snapshot_state
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.has_work = threading.Condition(self.lock)
+        self.flushed = threading.Condition(self.lock)
+        self.pending = []
+        self.appended = 0 # Sequence number of the last record queued
+        self.durable = 0 # Sequence number of the last record on disk
+        self.error = None
+        self.closing = False
+        self.segment = segment
+        self.segment_records = 0
+        self.file = open(segment_path(directory, segment), "a")
+        self.snapshotting = None
+        self.writer = threading.Thread(target=self._write_loop, name="wal-writer", daemon=True)
+        self.writer.start()
+
+    # Queue records and return the sequence number of the last one. Cheap
+    # enough to call while holding the lock of the changes being logged,
+    # which keeps the log in the same order as the changes
+    def append_many(self, records):
+        lines = [json.dumps(record, separators=(",", ":")) + "\n" for record in records]
+        with self.lock:
+            if self.closing:
+                raise RuntimeError("The write-ahead log is closed")
+            self.pending.extend(lines)
+            self.appended += len(lines)
+            self.has_work.notify()
+            return self.appended
+
+    # Block until the record `sequence` is on disk
+    def wait(self, sequence):
+        with self.lock:
+            while self.durable < sequence and self.error is None:
+                self.flushed.wait()
+            if self.error is not None:
+                raise OSError(f"Write-ahead log failed: {self.error}")
+
+    def _write_loop(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closing:
+                    self.has_work.wait()
+                if not self.pending and self.closing:
+                    return
+                batch, self.pending = self.pending, []
+                last = self.appended
+            try:
+                self.file.write("".join(batch))
+                self.file.flush()
+                if self.fsync:
+                    os.fsync(self.file.fileno())
+                self.segment_records += len(batch)
+                if self.segment_records >= self.snapshot_every:
+                    self._start_snapshot()
+            except OSError as e:
+                with self.lock:
+                    self.error = e
+                    self.flushed.notify_all()
+                return
+            with self.lock:
+                self.durable = last
+                self.flushed.notify_all()
+
+    # Runs in the writer thread between two batches: every record in the
+    # old segments is already applied in memory, so a snapshot taken from
+    # now on covers them. Records of the new segment that also made it into
+    # the snapshot are replayed on top of it, which is harmless as every
+    # record sets a value rather than changing it
+    def _start_snapshot(self):
+        if self.snapshotting is not None and self.snapshotting.is_alive():
+            return
+        self.file.close()
+        self.segment += 1
+        self.segment_records = 0
+        self.file = open(segment_path(self.directory, self.segment), "a")
+        self.snapshotting = threading.Thread(target=self.write_snapshot, args=(self.segment,),
+                                             name="wal-snapshot", daemon=True)
+        self.snapshotting.start()
+
+    def write_snapshot(self, segment):
+        state = self.snapshot_state()
+        state["segment"] = segment
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        fsync_directory(self.directory)
+        for number in list_segments(self.directory):
+            if number < segment:
+                os.remove(segment_path(self.directory, number))
+
+    # Write what is queued and stop the writer thread
+    def close(self):
+        with self.lock:
+            if self.closing:
+                return
+            self.closing = True
+            self.has_work.notify()
+        self.writer.join()
+        if self.snapshotting is not None:
+            self.snapshotting.join()
+        self.file.close()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# Concurrency stress test of the order store. Threads create, update and
+# cancel orders at once while others keep listing them; at the end every
+# order is checked against the last status its thread wrote. A lost order,
+# an overwritten ID or a lost status update fails the run (exit code 1).
+#   ./stress.py --threads 16 --orders 20000
+#   ./stress.py --flask --threads 8 --orders 2000   (through the Flask app)
+#   ./stress.py --data-dir /tmp/pizza-stress        (persisted, then reloaded)
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+import data
+
+# Statuses every order goes through; every CANCEL_EVERY-th order is then
+# cancelled instead of delivered
+STATUSES = ["preparing", "ready_for_delivery", "delivered"]
+CANCEL_EVERY = 5
+
+# Orders per page when paging through the indexes at the end
+PAGE_SIZE = 500
+
+# Seconds between two listings of a reader thread
+READER_PAUSE = 0.01
+
+ITEMS = [{"pizza_id": "pizza1", "quantity": 2}, {"pizza_id": "pizza3", "quantity": 1}]
+
+# Store operations called directly
+class StoreClient:
+    def create(self):
+        return data.create_new_order(ITEMS)["order_id"]
+
+    def update(self, order_id, status):
+        return data.update_order_status(order_id, status) is not None
+
+    def cancel(self, order_id):
+        return data.cancel_order(order_id)[0]
+
+    def list(self):
+        return data.list_orders()
+
+# The same operations through the HTTP endpoints, with Flask's test client
+class FlaskClient:
+    def __init__(self):
+        from app import app
+        self.client = app.test_client()
+        self.headers = {"X-Admin-Token": data.ADMIN_TOKEN}
+
+    def create(self):
+        return self.client.post("/order", json={"items": ITEMS}).get_json()["data"]["order_id"]
+
+    def update(self, order_id, status):
+        response = self.client.put(f"/admin/order/{order_id}/status", json={"status": status}, headers=self.headers)
+        return response.status_code == 200
+
+    def cancel(self, order_id):
+        return self.client.delete(f"/order/{order_id}").status_code == 200
+
+    # /admin/orders is paginated: follow the cursor to the last page
+    def list(self):
+        orders, params = [], {"limit": PAGE_SIZE}
+        while True:
+            response = self.client.get("/admin/orders", query_string=params, headers=self.headers).get_json()
+            orders.extend(response["data"])
+            if response["next_cursor"] is None:
+                return orders
+            params["cursor"] = response["next_cursor"]
+
+# One writer thread: returns {order_id: expected final status or None if
+# cancelled} and appends errors
+def writer(client, count, errors):
+    expected = {}
+    for n in range(count):
+        order_id = client.create()
+        # An ID can only come back once its order was cancelled
+        if expected.get(order_id) is not None:
+            errors.append(f"Order ID {order_id} returned twice")
+        expected[order_id] = "pending"
+        if n % CANCEL_EVERY == 0:
+            if not client.cancel(order_id):
+                errors.append(f"Order {order_id} couldn't be cancelled")
+            expected[order_id] = None
+            continue
+        for status in STATUSES:
+            if not client.update(order_id, status):
+                errors.append(f"Order {order_id} lost before its update to {status}")
+            expected[order_id] = status
+    return expected
+
+# Keep listing the orders until stopped: the listing mustn't fail while
+# the shards change under it. The pause keeps the readers from hogging the
+# GIL, which would starve writers waiting on the disk
+def reader(client, stop, errors, listings):
+    while not stop.wait(READER_PAUSE):
+        try:
+            client.list()
+            listings.append(1)
+        except Exception as e:
+            errors.append(f"Listing failed: {e!r}")
+            return
+
+def main():
+    parser = argparse.ArgumentParser(prog="stress.py", description="Concurrency stress test of the order store.")
+    parser.add_argument('-t', '--threads', type=int, default=16, help='Writer threads (default: 16)')
+    parser.add_argument('-n', '--orders', type=int, default=10000, help='Orders created per thread (default: 10000)')
+    parser.add_argument('-r', '--readers', type=int, default=2, help='Threads listing all orders meanwhile (default: 2)')
+    parser.add_argument('--flask', action='store_true', help='Go through the HTTP endpoints instead of the store functions')
+    parser.add_argument('--data-dir', help='Persist the orders in this new (or empty) directory, and check them after reloading it')
+    parser.add_argument('--snapshot-every', type=int, default=data.persistence.SNAPSHOT_EVERY,
+                        help='With --data-dir: log records between snapshots (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.data_dir:
+        if os.path.isdir(args.data_dir) and os.listdir(args.data_dir):
+            parser.error(f"{args.data_dir} is not empty")
+        data.open_storage(args.data_dir, args.snapshot_every)
+
+    make_client = FlaskClient if args.flask else StoreClient
+    errors, listings, results = [], [], [None] * args.threads
+    stop = threading.Event()
+
+    def run(index):
+        try:
+            results[index] = writer(make_client(), args.orders, errors)
+        except Exception as e:
+            errors.append(f"Writer {index} failed: {e!r}")
+            results[index] = {}
+
+    writers = [threading.Thread(target=run, args=(index,)) for index in range(args.threads)]
+    readers = [threading.Thread(target=reader, args=(make_client(), stop, errors, listings)) for _ in range(args.readers)]
+    started = time.perf_counter()
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    # Start over from what is on disk
+    if args.data_dir:
+        data.close_storage()
+        data.orders = data.OrderStore()
+        started = time.perf_counter()
+        replayed = data.open_storage(args.data_dir)
+        print(f"Reloaded {len(data.orders)} orders in {time.perf_counter() - started:.2f}s "
+              f"({replayed} log record(s) replayed after the snapshot)")
+        data.close_storage()
+
+    # Every order of every thread must be there with its last status, and
+    # nothing else. The ID of a cancelled order may have been given again
+    expected = {}
+    for result in results:
+        for order_id, status in result.items():
+            if expected.get(order_id) is not None and status is not None:
+                errors.append(f"Order ID {order_id} given to two threads")
+            if expected.get(order_id) is None:
+                expected[order_id] = status
+    live = {order_id: status for order_id, status in expected.items() if status is not None}
+    stored = {order["order_id"]: order["status"] for order in data.list_orders()}
+    for order_id, status in live.items():
+        if stored.get(order_id) != status:
+            errors.append(f"Order {order_id}: expected '{status}', found '{stored.get(order_id)}'")
+    for order_id in stored.keys() - live.keys():
+        errors.append(f"Order {order_id} should not exist")
+
+    # Paging through the indexes must give the same orders, oldest first
+    for status in [None, "pending"] + STATUSES:
+        paged, cursor = [], None
+        while True:
+            page, cursor = data.find_orders(status, cursor=cursor, limit=PAGE_SIZE)
+            paged.extend(order["order_id"] for order in page)
+            if cursor is None:
+                break
+        wanted = sorted(order_id for order_id, last in live.items() if status in (None, last))
+        if paged != wanted:
+            errors.append(f"Paging through {status or 'all'} orders gave {len(paged)}, expected {len(wanted)}")
+
+    created = args.threads * args.orders
+    cancelled = args.threads * len(range(0, args.orders, CANCEL_EVERY))
+    operations = created * (1 + len(STATUSES)) - cancelled * (len(STATUSES) - 1)
+    print(f"{created} orders by {args.threads} thread(s) in {elapsed:.2f}s: "
+          f"{created / elapsed:.0f} orders/sec, {operations / elapsed:.0f} operations/sec, "
+          f"{len(listings)} full listing(s) meanwhile")
+    for error in errors[:20]:
+        print(error, file=sys.stderr)
+    if errors:
+        print(f"FAILED: {len(errors)} error(s)")
+        sys.exit(1)
+    print(f"OK: {len(live)} orders with their last status, {cancelled} cancelled")
+
+if __name__ == "__main__":
+    main()
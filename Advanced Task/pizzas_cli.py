@@ -41,13 +41,11 @@ def list_menu(args):
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
-def create_order(items_str):
+def _parse_items(items_str):
     """
-    Creates a new order.
-    items_str format: "pizza_id:quantity,pizza_id:quantity"
-    Example: "pizza1:1,pizza3:2"
+    Parses "pizza_id:quantity,pizza_id:quantity" into a list of order items.
+    Returns None (after printing an error) if the format is invalid.
     """
-    print("Creating order...")
     items = []
     try:
         for item_pair in items_str.split(','):
@@ -55,6 +53,18 @@ def create_order(items_str):
             items.append({"pizza_id": pizza_id.strip(), "quantity": int(quantity_str.strip())})
     except ValueError:
         print("Error: Invalid items format. Use 'pizza_id:quantity,pizza_id:quantity'.")
+        return None
+    return items
+
+def create_order(items_str):
+    """
+    Creates a new order.
+    items_str format: "pizza_id:quantity,pizza_id:quantity"
+    Example: "pizza1:1,pizza3:2"
+    """
+    print("Creating order...")
+    items = _parse_items(items_str)
+    if items is None:
         return
 
     payload = {"items": items}
@@ -66,6 +76,28 @@ def create_order(items_str):
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
+def create_orders_batch(items_strs):
+    """
+    Creates several orders with one request, one order per items string.
+    Each order succeeds or fails on its own; the result of each is printed.
+    """
+    print(f"Creating {len(items_strs)} orders...")
+    orders = []
+    for items_str in items_strs:
+        items = _parse_items(items_str)
+        if items is None:
+            return
+        orders.append({"items": items})
+
+    payload = {"orders": orders}
+    try:
+        response = requests.post(f"{BASE_URL}/orders/batch", json=payload)
+        _handle_response(response)
+    except requests.exceptions.ConnectionError:
+        print("Error: Could not connect to the server. Is the Flask server running?")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+
 def check_order_status(order_id):
     """Checks the status of a specific order."""
     print(f"Checking status for order ID: {order_id}...")
@@ -125,13 +157,26 @@ def cancel_admin_order(order_id, admin_token):
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
-def list_all_orders(admin_token):
-    """Lists all orders (admin only)."""
-    print("Listing all orders (admin action)...")
+def list_all_orders(admin_token, status=None, since=None, until=None, limit=None, cursor=None, all_pages=False):
+    """
+    Lists orders one page at a time, oldest first (admin only).
+    With all_pages the following pages are fetched too.
+    """
+    print("Listing orders (admin action)...")
     headers = {"X-Admin-Token": admin_token}
+    params = {"status": status, "since": since, "until": until, "limit": limit, "cursor": cursor}
     try:
-        response = requests.get(f"{BASE_URL}/admin/orders", headers=headers)
-        _handle_response(response)
+        while True:
+            response = requests.get(f"{BASE_URL}/admin/orders", headers=headers,
+                                    params={key: value for key, value in params.items() if value is not None})
+            _handle_response(response)
+            next_cursor = response.json().get("next_cursor") if response.ok else None
+            if not next_cursor:
+                break
+            if not all_pages:
+                print(f"More orders: rerun with --cursor {next_cursor}")
+                break
+            params["cursor"] = next_cursor
     except requests.exceptions.ConnectionError:
         print("Error: Could not connect to the server. Is the Flask server running?")
     except Exception as e:
@@ -150,6 +195,19 @@ def update_order_status(order_id, status, admin_token):
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
+def bulk_update_order_status(order_ids, status, admin_token):
+    """Sets the same status on several orders with one request (admin only)."""
+    print(f"Updating status for {len(order_ids)} orders to '{status}' (admin action)...")
+    headers = {"X-Admin-Token": admin_token}
+    payload = {"updates": [{"order_id": order_id, "status": status} for order_id in order_ids]}
+    try:
+        response = requests.patch(f"{BASE_URL}/admin/orders/status", headers=headers, json=payload)
+        _handle_response(response)
+    except requests.exceptions.ConnectionError:
+        print("Error: Could not connect to the server. Is the Flask server running?")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+
 # --- Main CLI Logic ---
 
 def main():
@@ -173,6 +231,15 @@ def main():
     )
     order_create_parser.set_defaults(func=lambda args: create_order(args.items))
 
+    # Create Several Orders
+    order_create_batch_parser = order_subparsers.add_parser("create-batch", help="Create several orders with one request.")
+    order_create_batch_parser.add_argument(
+        "orders",
+        nargs="+",
+        help="One pizza_id:quantity list per order (e.g., 'pizza1:1,pizza3:2' 'pizza2:1'), at most 500"
+    )
+    order_create_batch_parser.set_defaults(func=lambda args: create_orders_batch(args.orders))
+
     # Order Status
     order_status_parser = order_subparsers.add_parser("status", help="Check the status of an order.")
     order_status_parser.add_argument("order_id", help="The ID of the order to check.")
@@ -206,8 +273,16 @@ def main():
     admin_cancel_order_parser.set_defaults(func=lambda args: cancel_admin_order(args.order_id, args.token))
 
     # Admin List All Orders
-    admin_list_orders_parser = admin_subparsers.add_parser("list-orders", help="List all orders.")
-    admin_list_orders_parser.set_defaults(func=lambda args: list_all_orders(args.token))
+    admin_list_orders_parser = admin_subparsers.add_parser("list-orders", help="List orders, one page at a time.")
+    admin_list_orders_parser.add_argument("--status", choices=["pending", "preparing", "ready_for_delivery", "delivered", "cancelled"],
+                                          help="Only orders with this status.")
+    admin_list_orders_parser.add_argument("--since", help="Only orders created at or after this time (e.g., 2025-05-20T18:00:00).")
+    admin_list_orders_parser.add_argument("--until", help="Only orders created at or before this time.")
+    admin_list_orders_parser.add_argument("--limit", type=int, help="Orders per page (server default: 100).")
+    admin_list_orders_parser.add_argument("--cursor", help="Cursor of the page to fetch, as printed after the previous page.")
+    admin_list_orders_parser.add_argument("--all", action="store_true", help="Fetch every page.")
+    admin_list_orders_parser.set_defaults(func=lambda args: list_all_orders(args.token, args.status, args.since, args.until,
+                                                                            args.limit, args.cursor, args.all))
 
     # Admin Update Order Status
     admin_update_status_parser = admin_subparsers.add_parser("update-status", help="Update an order's status.")
@@ -216,6 +291,13 @@ def main():
                                             help="New status for the order.")
     admin_update_status_parser.set_defaults(func=lambda args: update_order_status(args.order_id, args.status, args.token))
 
+    # Admin Bulk Update Order Status
+    admin_bulk_status_parser = admin_subparsers.add_parser("bulk-status", help="Set the same status on several orders at once.")
+    admin_bulk_status_parser.add_argument("status", choices=["pending", "preparing", "ready_for_delivery", "delivered", "cancelled"],
+                                          help="New status for the orders.")
+    admin_bulk_status_parser.add_argument("order_ids", nargs="+", help="The IDs of the orders to update (at most 500).")
+    admin_bulk_status_parser.set_defaults(func=lambda args: bulk_update_order_status(args.order_ids, args.status, args.token))
+
 
     args = parser.parse_args()
 
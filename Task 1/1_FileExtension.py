@@ -1,19 +1,220 @@
 #!/usr/bin/env python3
 # Script to get the file extension from a file
+import os
 import sys
+import stat
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+import filemagic
 
-# Check number of arguments
-if len(sys.argv) != 2:
-    print("Usage: ./1_FileExtension.py <filename>")
-    sys.exit(1)
+# Multi-part extensions reported as a whole (lowercase, without the first dot)
+COMPOUND_EXTENSIONS = ("tar.gz", "tar.bz2", "tar.xz", "tar.zst", "tar.lz4", "tar.lzma", "tar.z")
 
-filename = sys.argv[1]
+# Paths from stdin stat'ed by one thread task
+STDIN_BATCH = 256
 
-# Check if filename is valid
-if "." not in filename :
-    raise ValueError("Filename must contain at least one dot (.)")
+# Get the file extension of a filename
+def get_extension(filename):
+    # Check if filename is valid
+    if "." not in filename :
+        raise ValueError("Filename must contain at least one dot (.)")
+    return filename.split(".")[-1]
 
-# Get the file extension
-file_extention = filename.split(".")[-1]
+# Extension used to group files in the batch modes: lowercase, compound
+# extensions like "tar.gz" kept whole, "" when there is none. Leading dots
+# mark hidden files, so ".bashrc" has no extension
+def classify(filename):
+    name = os.path.basename(filename).lstrip(".").lower()
+    if "." not in name:
+        return ""
+    for compound in COMPOUND_EXTENSIONS:
+        if name.endswith("." + compound):
+            return compound
+    return name.rsplit(".", 1)[1]
 
-print(f"File extension: .{file_extention}")
\ No newline at end of file
+# --- Batch mode ---
+# Every task returns a tally (counts, sizes, mismatches, errors): files and
+# bytes per key, (extension, detected type) pairs that don't agree and the
+# paths that couldn't be read as (path, reason). Keys are the extension, or
+# "[type]" for the type detected from the content with --sniff
+
+def new_tally():
+    return Counter(), Counter(), Counter(), []
+
+# Tally one regular file. With a sniff cache the file is classified by its
+# content when the type can be detected
+def tally_file(tally, path, st, cache=None):
+    counts, sizes, mismatches, _ = tally
+    key = extension = classify(path)
+    if cache is not None:
+        file_type = filemagic.sniff(path, cache, st)
+        if file_type is not None:
+            key = f"[{file_type}]"
+            if not filemagic.matches_extension(file_type, extension):
+                mismatches[extension, file_type] += 1
+    counts[key] += 1
+    sizes[key] += st.st_size
+
+# Tally the regular files of one directory. Returns the subdirectories too,
+# so the walk can go on in other threads. Symlinks aren't followed
+def scan_directory(path, cache=None):
+    tally, subdirs = new_tally(), []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        tally_file(tally, entry.path, entry.stat(follow_symlinks=False), cache)
+                except OSError as e:
+                    tally[3].append((entry.path, e.strerror))
+    except OSError as e:
+        tally[3].append((path, e.strerror))
+    return subdirs, tally
+
+# Tally a list of paths (regular files only)
+def scan_paths(paths, cache=None):
+    tally = new_tally()
+    for path in paths:
+        try:
+            st = os.stat(path)
+            if stat.S_ISDIR(st.st_mode):
+                tally[3].append((path, "Is a directory"))
+                continue
+            tally_file(tally, path, st, cache)
+        except OSError as e:
+            tally[3].append((path, e.strerror))
+    return tally
+
+def merge_tally(total, tally):
+    for total_part, part in zip(total, tally):
+        if isinstance(total_part, Counter):
+            total_part.update(part)
+        else:
+            total_part.extend(part)
+
+# Walk directory trees with a pool of threads, one directory per task.
+# Threads help on network and other high latency filesystems, where most
+# of the time is spent waiting for directory listings and stat calls
+def scan_trees(roots, threads=8, cache=None):
+    total = new_tally()
+    files = [root for root in roots if not os.path.isdir(root)]
+    merge_tally(total, scan_paths(files, cache))
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = {executor.submit(scan_directory, root, cache) for root in roots if os.path.isdir(root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirs, tally = future.result()
+                merge_tally(total, tally)
+                pending.update(executor.submit(scan_directory, subdir, cache) for subdir in subdirs)
+    return total
+
+# Tally a stream of paths (one per line) with a pool of threads. At most a
+# few batches per thread are queued, so the list is never held in memory
+def scan_stream(stream, threads=8, cache=None):
+    total = new_tally()
+    paths = filter(None, (line.rstrip("\n") for line in stream))
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = set()
+        while True:
+            while len(pending) < threads * 4:
+                batch = list(islice(paths, STDIN_BATCH))
+                if not batch:
+                    break
+                pending.add(executor.submit(scan_paths, batch, cache))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                merge_tally(total, future.result())
+    return total
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024 or unit == "TB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+def extension_name(extension):
+    return f".{extension}" if extension else "(none)"
+
+def print_tally(counts, sizes, mismatches, errors, top=None):
+    for path, reason in errors:
+        print(f"Skipped {path}: {reason}", file=sys.stderr)
+    for key, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top]:
+        name = key if key.startswith("[") else extension_name(key)
+        print(f"{name}: {count} file(s), {format_bytes(sizes[key])}")
+    print(f"Total: {sum(counts.values())} file(s), {format_bytes(sum(sizes.values()))}")
+    for (extension, file_type), count in sorted(mismatches.items(), key=lambda item: (-item[1], item[0]))[:top]:
+        print(f"Mismatch: {count} {extension_name(extension)} file(s) detected as [{file_type}]")
+
+def sniff_mode(args, cache):
+    try:
+        file_type = filemagic.sniff(args.filename, cache)
+    except FileNotFoundError:
+        print(f"File {args.filename} not found.")
+        sys.exit(1)
+    except OSError as e:
+        print(f"Can't read {args.filename}: {e.strerror}")
+        sys.exit(1)
+    extension = classify(args.filename)
+    print(f"File extension: {extension_name(extension)}")
+    print(f"Detected type: {file_type or 'unknown'}")
+    if file_type is not None and not filemagic.matches_extension(file_type, extension):
+        print(f"Warning: the extension doesn't match the content ({file_type})")
+
+def main():
+    parser = argparse.ArgumentParser(prog="1_FileExtension.py",
+                                     description="Get the extension of a filename, or extension statistics of whole trees.")
+    parser.add_argument('filename', nargs='?', help='Filename to get the extension from')
+    parser.add_argument('--scan', nargs='+', metavar='DIR', help='Tally files and bytes per extension under these directories')
+    parser.add_argument('--stdin', action='store_true', help='Tally the paths read from stdin, one per line')
+    parser.add_argument('-t', '--threads', type=int, default=8, help='With --scan/--stdin: number of threads (default: 8)')
+    parser.add_argument('-n', '--top', type=int, help='With --scan/--stdin: only print the N most common extensions')
+    parser.add_argument('--sniff', action='store_true', help='Detect the file type from the first bytes of the content')
+    parser.add_argument('--cache', metavar='FILE', help='With --sniff: load and save the detected types in FILE, so unchanged files are not read again')
+    parser.add_argument('--cache-size', type=int, default=1000000, help='With --sniff: most recently used entries kept in the cache (default: 1000000)')
+    args = parser.parse_args()
+
+    # Check number of arguments
+    if [args.filename is not None, args.scan is not None, args.stdin].count(True) != 1:
+        print("Usage: ./1_FileExtension.py <filename> | --scan <dir> [<dir> ...] | --stdin")
+        sys.exit(1)
+    if args.threads < 1:
+        parser.error("--threads must be at least 1")
+    if args.cache and not args.sniff:
+        parser.error("--cache needs --sniff")
+
+    cache = None
+    if args.sniff:
+        cache = filemagic.SniffCache(args.cache_size)
+        if args.cache:
+            try:
+                cache.load(args.cache)
+            except (ValueError, KeyError) as e:
+                print(f"Ignoring unreadable cache {args.cache} ({e})", file=sys.stderr)
+
+    if args.scan or args.stdin:
+        if args.scan:
+            tally = scan_trees(args.scan, args.threads, cache)
+        else:
+            tally = scan_stream(sys.stdin, args.threads, cache)
+        print_tally(*tally, args.top)
+        if cache is not None:
+            print(f"Sniff cache: {cache.hits} hit(s), {cache.misses} miss(es)", file=sys.stderr)
+    elif args.sniff:
+        sniff_mode(args, cache)
+    else:
+        file_extention = get_extension(args.filename)
+
+        print(f"File extension: .{file_extention}")
+
+    if args.cache:
+        cache.save(args.cache)
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,410 @@
 #!/usr/bin/env python3
 # Script to remove duplicates from a list, create a tuple, and find the max and min values
 
+import os
 import sys
 import ast
+import json
+import heapq
+import array
+import shutil
+import argparse
+import tempfile
 
-# Check number of arguments
-if len(sys.argv) != 2:
-    print('Usage: ./2_RemoveDuplicates.py "[<list>]"')
-    sys.exit(1)
-
-# Convert argument to list
 try:
-    input_list = ast.literal_eval(sys.argv[1]) 
+    import numpy as np
+except ImportError:
+    np = None
+
+# Integers read per chunk when reading from a file or stdin
+DEFAULT_CHUNK = 1 << 20
+
+# Convert a "[<int>, <int>, ...]" string to a list of integers
+def parse_list(text):
+    input_list = ast.literal_eval(text)
     # Check if it's a list of integers
     if not isinstance(input_list, list) or not all(isinstance(i, int) for i in input_list):
-        raise ValueError
-except:
-    print('Invalid list format. Format should be "[<int>, <int>, <int>, ...]"')
-    sys.exit(1)
-
-# Remove duplicates and create tuple
-unique_tuple = tuple(set(input_list))
-
-# Print results
-print(f"List:  {input_list}")  
-print(f"Tuple: {unique_tuple}")
-print(f"Min: {min(unique_tuple)}")
-print(f"Max: {max(unique_tuple)}")
+        raise ValueError("Expected a list of integers")
+    return input_list
+
+# Remove duplicates and create tuple. Returns the tuple, its min and its max
+def remove_duplicates(input_list):
+    unique_tuple = tuple(set(input_list))
+    return unique_tuple, min(unique_tuple), max(unique_tuple)
+
+# --- Streaming mode (files and stdin) ---
+
+# Turn a list of integer tokens into an int64 chunk
+def to_chunk(tokens):
+    if np is not None:
+        return np.array(tokens, dtype=np.int64)
+    return array.array("q", map(int, tokens))
+
+# Brackets and commas separate integers just like whitespace
+SEPARATORS = bytes.maketrans(b"[],", b"   ")
+
+# Read integers written as text (separated by spaces, commas or newlines,
+# optionally inside [ ]) in chunks of about `chunk` integers
+def read_text_chunks(stream, chunk=DEFAULT_CHUNK):
+    rest = b""
+    while True:
+        block = stream.read(chunk * 8)
+        if not block:
+            break
+        text = (rest + block).translate(SEPARATORS)
+        tokens = text.split()
+        # The last token may continue in the next block
+        rest = tokens.pop() if tokens and not text[-1:].isspace() else b""
+        if tokens:
+            yield to_chunk(tokens)
+    tokens = rest.split()
+    if tokens:
+        yield to_chunk(tokens)
+
+# Read raw little-endian int64 integers in chunks of `chunk` integers
+def read_binary_chunks(stream, chunk=DEFAULT_CHUNK):
+    rest = b""
+    while True:
+        block = stream.read(chunk * 8)
+        if not block:
+            break
+        block = rest + block
+        usable = len(block) - len(block) % 8
+        rest = block[usable:]
+        if np is not None:
+            yield np.frombuffer(block[:usable], dtype="<i8")
+        else:
+            values = array.array("q", block[:usable])
+            if sys.byteorder == "big":
+                values.byteswap()
+            yield values
+    if rest:
+        raise ValueError(f"binary input has {len(rest)} trailing byte(s), it isn't a multiple of 8")
+
+# Sort and drop repeated neighbours. Plain sort + mask is used instead of
+# np.unique, which may pick a slower hash-based path for integers
+def sorted_unique(values):
+    values = np.sort(values)
+    if len(values) < 2:
+        return values
+    keep = np.empty(len(values), dtype=bool)
+    keep[0] = True
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    return values[keep]
+
+# Deduplicate chunks of integers. With NumPy every chunk is sort-uniqued and
+# the sorted unique arrays are merged, so memory stays near 8 bytes per
+# distinct integer. Min and max come from the ends of the sorted result.
+# Without NumPy a set is used and min/max are tracked chunk by chunk.
+# Returns (unique values, count, unique count, min, max)
+def dedup_chunks(chunks):
+    count = 0
+    if np is not None:
+        unique = np.empty(0, dtype=np.int64)
+        pending = []
+        pending_size = 0
+        for values in chunks:
+            count += len(values)
+            pending.append(sorted_unique(values))
+            pending_size += len(pending[-1])
+            # Merge once the pending uniques are as big as the result, so
+            # every value is merged an amortized O(log n) times
+            if pending_size >= max(len(unique), DEFAULT_CHUNK):
+                unique = sorted_unique(np.concatenate([unique] + pending))
+                pending, pending_size = [], 0
+        if pending:
+            unique = sorted_unique(np.concatenate([unique] + pending))
+        if not len(unique):
+            return unique, count, 0, None, None
+        return unique, count, len(unique), int(unique[0]), int(unique[-1])
+
+    unique = set()
+    minimum = maximum = None
+    for values in chunks:
+        if not len(values):
+            continue
+        count += len(values)
+        unique.update(values)
+        low, high = min(values), max(values)
+        minimum = low if minimum is None else min(minimum, low)
+        maximum = high if maximum is None else max(maximum, high)
+    return unique, count, len(unique), minimum, maximum
+
+# --- External (out-of-core) mode ---
+
+# Odd 64-bit constant (golden ratio) used to spread integers over partitions
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# Number of partitions (a power of two) so that one partition, its sort
+# and its copy fit in the memory budget
+def plan_partitions(input_size, binary, memory_budget):
+    values = input_size // 8 if binary else input_size // 4
+    partitions = 1
+    while partitions < 4096 and values * 8 * 3 / partitions > memory_budget:
+        partitions *= 2
+    return partitions
+
+# Split a chunk into {partition: values} by multiplicative hashing. Every
+# copy of an integer always lands in the same partition
+def hash_partition(values, bits):
+    if bits == 0:
+        return {0: values}
+    if np is not None:
+        hashes = (values.view(np.uint64) * np.uint64(HASH_MULTIPLIER)) >> np.uint64(64 - bits)
+        order = np.argsort(hashes, kind="stable")
+        hashes = hashes[order]
+        values = values[order]
+        bounds = np.searchsorted(hashes, np.arange(1, 1 << bits, dtype=np.uint64))
+        return {p: part for p, part in enumerate(np.split(values, bounds)) if len(part)}
+    parts = {}
+    for value in values:
+        p = ((value * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> (64 - bits)
+        parts.setdefault(p, array.array("q")).append(value)
+    return parts
+
+def write_int64(path, values, mode="ab"):
+    with open(path, mode) as f:
+        if np is not None:
+            f.write(np.asarray(values, dtype="<i8").tobytes())
+        else:
+            values = array.array("q", values)
+            if sys.byteorder == "big":
+                values.byteswap()
+            values.tofile(f)
+
+def load_manifest(workdir, identity):
+    path = os.path.join(workdir, "manifest.json")
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        if manifest["input"] != identity:
+            raise ValueError(f"work directory {workdir} belongs to another input, use a new one")
+        # Nothing tells two stdin inputs apart, and stdin can't be read again
+        if identity["path"] == "-":
+            raise ValueError(f"work directory {workdir} is from an earlier run, stdin can't be resumed: use a new one")
+        return manifest
+    return {"input": identity, "partitions": None, "partitioned": False, "count": 0, "done": {}}
+
+def save_manifest(workdir, manifest):
+    tmp = os.path.join(workdir, "manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(workdir, "manifest.json"))
+
+def progress(enabled, message):
+    if enabled:
+        print(message, file=sys.stderr, flush=True)
+
+# Deduplicate an input bigger than memory. Phase 1 hash-partitions the
+# integers into spill files under workdir (each chunk is deduplicated
+# before it is spilled). Phase 2 deduplicates one partition at a time and
+# keeps it as a sorted unique file. The manifest in workdir records what is
+# finished, so an interrupted run resumes from the last completed step.
+# Returns (count, unique count, min, max, sorted unique partition files)
+def external_dedup(open_input, identity, workdir, binary, memory_budget, partitions=None, chunk=DEFAULT_CHUNK, verbose=False):
+    os.makedirs(workdir, exist_ok=True)
+    manifest = load_manifest(workdir, identity)
+    if manifest["partitions"] is None:
+        manifest["partitions"] = partitions or plan_partitions(identity["size"] or 0, binary, memory_budget)
+    partitions = manifest["partitions"]
+    bits = partitions.bit_length() - 1
+    chunk = max(1, min(chunk, memory_budget // 32))
+    part_path = lambda p: os.path.join(workdir, f"part-{p:05d}.bin")
+    uniq_path = lambda p: os.path.join(workdir, f"uniq-{p:05d}.bin")
+
+    # Phase 1: partition (restarted from scratch if it was interrupted)
+    if not manifest["partitioned"]:
+        for p in range(partitions):
+            if os.path.exists(part_path(p)):
+                os.remove(part_path(p))
+        count = 0
+        with open_input() as stream:
+            reader = read_binary_chunks if binary else read_text_chunks
+            for values in reader(stream, chunk):
+                count += len(values)
+                values = sorted_unique(values) if np is not None else array.array("q", set(values))
+                for p, part in hash_partition(values, bits).items():
+                    write_int64(part_path(p), part)
+                progress(verbose, f"Partitioned {count} integer(s)")
+        manifest.update(partitioned=True, count=count)
+        save_manifest(workdir, manifest)
+
+    # Phase 2: deduplicate every partition that isn't done yet
+    for p in range(partitions):
+        if str(p) in manifest["done"]:
+            continue
+        unique = []
+        if os.path.exists(part_path(p)):
+            with open(part_path(p), "rb") as f:
+                unique = dedup_chunks(read_binary_chunks(f, chunk))[0]
+            if np is None:
+                unique = sorted(unique)
+        write_int64(uniq_path(p), unique, "wb")
+        manifest["done"][str(p)] = [len(unique), int(unique[0]), int(unique[-1])] if len(unique) else [0, None, None]
+        save_manifest(workdir, manifest)
+        if os.path.exists(part_path(p)):
+            os.remove(part_path(p))
+        progress(verbose, f"Deduplicated partition {p + 1}/{partitions}")
+
+    done = [manifest["done"][str(p)] for p in range(partitions)]
+    lows = [low for _, low, _ in done if low is not None]
+    highs = [high for _, _, high in done if high is not None]
+    return (manifest["count"], sum(n for n, _, _ in done), min(lows, default=None), max(highs, default=None),
+            [uniq_path(p) for p in range(partitions)])
+
+# Stream the sorted unique values of all partitions, merged in order
+def iter_sorted(files, chunk=DEFAULT_CHUNK):
+    def values(path):
+        with open(path, "rb") as f:
+            for block in read_binary_chunks(f, chunk):
+                yield from (block.tolist() if np is not None else block)
+    return heapq.merge(*(values(path) for path in files))
+
+def write_sorted(output, files, binary):
+    with open(output, "wb") as f:
+        batch = []
+        for value in iter_sorted(files):
+            batch.append(value)
+            if len(batch) == DEFAULT_CHUNK:
+                write_batch(f, batch, binary)
+                batch = []
+        write_batch(f, batch, binary)
+
+def write_batch(f, batch, binary):
+    if not batch:
+        return
+    if binary:
+        values = array.array("q", batch)
+        if sys.byteorder == "big":
+            values.byteswap()
+        values.tofile(f)
+    else:
+        f.write("\n".join(map(str, batch)).encode() + b"\n")
+
+def external_mode(args):
+    identity = {"path": os.path.abspath(args.file) if args.file != "-" else "-", "binary": args.binary,
+                "size": None, "mtime_ns": None}
+    if args.file == "-":
+        open_input = lambda: open(sys.stdin.fileno(), "rb", closefd=False)
+    else:
+        open_input = lambda: open(args.file, "rb")
+    workdir = args.workdir or tempfile.mkdtemp(prefix="dedup-")
+    try:
+        if args.file != "-":
+            st = os.stat(args.file)
+            identity.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+        count, unique_count, minimum, maximum, files = external_dedup(
+            open_input, identity, workdir, args.binary, args.memory * 1024 * 1024,
+            args.partitions, args.chunk, args.progress)
+        if args.output and count:
+            progress(args.progress, f"Writing sorted unique values to {args.output}")
+            write_sorted(args.output, files, args.binary)
+    except FileNotFoundError:
+        print(f"File {args.file} not found.")
+        sys.exit(1)
+    except (ValueError, OverflowError) as e:
+        print(f"Error deduplicating {args.file}: {e}")
+        if args.workdir:
+            print(f"Spill files are kept in {workdir}.")
+        sys.exit(1)
+    finally:
+        # Only a --workdir can be resumed, a temporary one is always removed
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # Check if input is empty
+    if not count:
+        print(f"File {args.file} is empty.")
+        sys.exit(1)
+
+    # Print results
+    print(f"Count: {count}")
+    print(f"Unique: {unique_count}")
+    print(f"Min: {minimum}")
+    print(f"Max: {maximum}")
+
+def stream_mode(args):
+    try:
+        if args.file == "-":
+            stream = sys.stdin.buffer
+        else:
+            stream = open(args.file, "rb")
+        with stream:
+            reader = read_binary_chunks if args.binary else read_text_chunks
+            _, count, unique_count, minimum, maximum = dedup_chunks(reader(stream, args.chunk))
+    except FileNotFoundError:
+        print(f"File {args.file} not found.")
+        sys.exit(1)
+    except (ValueError, OverflowError) as e:
+        print(f"Invalid integer data in {args.file}: {e}")
+        sys.exit(1)
+
+    # Check if input is empty
+    if not count:
+        print(f"File {args.file} is empty.")
+        sys.exit(1)
+
+    # Print results
+    print(f"Count: {count}")
+    print(f"Unique: {unique_count}")
+    print(f"Min: {minimum}")
+    print(f"Max: {maximum}")
+
+def main():
+    parser = argparse.ArgumentParser(prog="2_RemoveDuplicates.py",
+                                     description="Remove duplicates from a list of integers and find its min and max.")
+    parser.add_argument('list', nargs='?', help='List of integers, e.g. "[1, 2, 2, 3]"')
+    parser.add_argument('-f', '--file', help='Read the integers from a file ("-" for stdin) instead of the argument')
+    parser.add_argument('--binary', action='store_true', help='With --file: the input is raw little-endian int64')
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK, help=f'With --file: integers read per chunk (default: {DEFAULT_CHUNK})')
+    parser.add_argument('--external', action='store_true', help='With --file: out-of-core mode for inputs bigger than memory')
+    parser.add_argument('--memory', type=int, default=512, help='With --external: memory budget in MB (default: 512)')
+    parser.add_argument('--partitions', type=int, help='With --external: number of hash partitions (a power of two, default: from --memory)')
+    parser.add_argument('--workdir', help='With --external: directory for the spill files. It is kept, so an interrupted run can be resumed')
+    parser.add_argument('-o', '--output', help='With --external: write the sorted unique values to this file')
+    parser.add_argument('--progress', action='store_true', help='With --external: report progress on stderr')
+    args = parser.parse_args()
+
+    # Check number of arguments
+    if (args.list is None) == (args.file is None):
+        print('Usage: ./2_RemoveDuplicates.py "[<list>]" | --file <file|->')
+        sys.exit(1)
+    if args.chunk <= 0:
+        parser.error("--chunk must be a positive number")
+
+    if args.external and not args.file:
+        parser.error("--external needs --file")
+    # The partitions are planned from the file size, which stdin hasn't got
+    if args.external and args.file == "-" and args.partitions is None:
+        parser.error("--external with stdin needs --partitions")
+    if args.memory <= 0:
+        parser.error("--memory must be a positive number")
+    if args.partitions is not None and (args.partitions <= 0 or args.partitions & (args.partitions - 1)):
+        parser.error("--partitions must be a power of two")
+    if (args.output or args.workdir or args.progress) and not args.external:
+        parser.error("--output, --workdir and --progress need --external")
+
+    if args.external:
+        external_mode(args)
+        return
+    if args.file:
+        stream_mode(args)
+        return
+
+    # Convert argument to list
+    try:
+        input_list = parse_list(args.list)
+    except:
+        print('Invalid list format. Format should be "[<int>, <int>, <int>, ...]"')
+        sys.exit(1)
+
+    unique_tuple, minimum, maximum = remove_duplicates(input_list)
+
+    # Print results
+    print(f"List:  {input_list}")
+    print(f"Tuple: {unique_tuple}")
+    print(f"Min: {minimum}")
+    print(f"Max: {maximum}")
+
+if __name__ == "__main__":
+    main()
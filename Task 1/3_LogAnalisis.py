@@ -1,40 +1,640 @@
-#!/usr/bin/env python3 
-# Script to analyze a logs and provide stadistics on User Agents
+#!/usr/bin/env python3
+# Script to analyze a logs and provide stadistics on User Agents and other
+# combined-log-format fields
 
+import os
+import errno
 import sys
 import re
+import io
+import gzip
+import bz2
+import mmap
+import time
+import json
+import signal
+import argparse
+import datetime
 from collections import Counter
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from logsketch import DimensionSketch
+import logindex
 
-# Check number of arguments
-if len(sys.argv) != 2:
-    print("Usage: ./3_LogAnalisis.py <filename>")
-    sys.exit(1)
-
-file = sys.argv[1]
-
-# Check if file exists
-try:
-    with open(file, 'r') as f:
-        lines = f.readlines()
-except FileNotFoundError:
-    print(f"File {file} not found.")
-    sys.exit(1)
-except Exception as e:
-    print(f"Error reading file {file}: {e}")
-    sys.exit(1)
-
-# Check if file is empty
-if not lines:
-    print(f"File {file} is empty.")
-    sys.exit(1)
-
-# Count user agents with Counter
-user_agents = Counter()
-for line in lines:
-    match = re.search(r'"([^"]*)"$', line.strip()) 
-    if match:
-        user_agents[match.group(1)] += 1
-
-# Print result analiisis
-for ua, count in user_agents.items():
-    print(f"{count} request(s) by : {ua}")
+# Size of the byte ranges a plain log is split into for the worker pool
+DEFAULT_CHUNK_MB = 64
+
+# Size of the blocks the memory mapped scanner splits into lines at once
+MMAP_BLOCK = 4 * 1024 * 1024
+
+# Lines counted exactly before they are folded into the sketches (--sketch)
+SKETCH_BATCH = 50000
+
+# Compressed logs and stdin can't be seeked, so they are read as one task
+def is_splittable(file):
+    return file != "-" and not file.endswith((".gz", ".bz2"))
+
+# Open a log as a text stream. Supports stdin ("-") and .gz/.bz2 rotations.
+# Lines are only split on "\n" so every mode sees exactly the same lines
+def open_log(file):
+    if file == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace", newline="\n")
+    if file.endswith(".gz"):
+        return gzip.open(file, "rt", encoding="utf-8", errors="replace", newline="\n")
+    if file.endswith(".bz2"):
+        return bz2.open(file, "rt", encoding="utf-8", errors="replace", newline="\n")
+    return open(file, "r", encoding="utf-8", errors="replace", newline="\n")
+
+# Yield the lines that start inside [start, end) of a plain log. A line that
+# crosses the end belongs to this range, one that crosses the start doesn't
+def read_range(file, start, end):
+    with open(file, "rb") as f:
+        pos = 0
+        if start:
+            f.seek(start - 1)
+            f.readline()
+            pos = f.tell()
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode("utf-8", errors="replace")
+
+# Yield the raw lines of [start, end) of a plain log from a memory map,
+# with the same line ownership as read_range. The map is cut into large
+# newline-aligned blocks that are split in C and yielded as lists of bytes
+def read_blocks_mmap(file, start=0, end=None):
+    with open(file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm) if end is None else end
+            pos = line_start(mm, start)
+            end = line_start(mm, end)
+            while pos < end:
+                stop = line_start(mm, min(pos + MMAP_BLOCK, end))
+                lines = mm[pos:stop].split(b"\n")
+                if not lines[-1]:
+                    lines.pop()
+                yield lines
+                pos = stop
+
+# First line start at or after offset
+def line_start(mm, offset):
+    if offset <= 0 or offset >= len(mm):
+        return max(0, min(offset, len(mm)))
+    newline = mm.find(b"\n", offset - 1)
+    return len(mm) if newline < 0 else newline + 1
+
+# Decode the bytes keys of the counters. Called once at the end, so each
+# distinct key is decoded only once
+def decode_counters(counters):
+    decoded = {}
+    for dim, counter in counters.items():
+        decoded[dim] = Counter()
+        for key, count in counter.items():
+            if isinstance(key, bytes):
+                key = key.decode("utf-8", errors="replace")
+            decoded[dim][key] += count
+    return decoded
+
+# Fields of a parsed combined-log-format record
+FIELDS = ("ip", "time", "method", "path", "status", "bytes", "referer", "ua")
+
+# Dimensions that can be aggregated and their report headers
+DIMENSIONS = {
+    "ua": "USER AGENTS",
+    "ip": "CLIENT IPS",
+    "status": "STATUS CODES",
+    "method": "METHODS",
+    "path": "PATHS",
+    "bytes": "BYTES SENT",
+    "hour": "HOUR OF DAY",
+}
+
+# Slow path for lines the field splitter can't handle
+LOG_PATTERN = re.compile(r'^(\S+) \S+ \S+ \[([^\]]*)\] "(.*)" (\S+) (\S+) "(.*)" "([^"]*)"$')
+UA_PATTERN = re.compile(r'"([^"]*)"$')
+
+# Split the request line ("GET /path HTTP/1.1") into method and path
+def split_request(request):
+    method, _, rest = request.partition(" ")
+    path, sep, _ = rest.rpartition(" ")
+    return method, (path if sep else rest)
+
+# Parse a combined-log-format line into a tuple ordered like FIELDS.
+# A well formed line has exactly 6 quotes, so it is split on them instead
+# of running a regex. Unknown fields are None
+def parse_line(line):
+    parts = line.split('"')
+    if len(parts) == 7 and not parts[6].strip():
+        prefix, request, middle, referer, _, ua, _ = parts
+        ip = prefix.partition(" ")[0]
+        timestamp = prefix[prefix.find("[") + 1:prefix.rfind("]")]
+        status, _, size = middle.strip().partition(" ")
+    else:
+        line = line.strip()
+        match = LOG_PATTERN.match(line)
+        if not match:
+            # Keep counting the user agent of lines that aren't combined format
+            match = UA_PATTERN.search(line)
+            if not match:
+                return None
+            return (None,) * 7 + (match.group(1),)
+        ip, timestamp, request, status, size, referer, ua = match.groups()
+    method, path = split_request(request)
+    return ip, timestamp, method, path, status, size, referer, ua
+
+# Same as parse_line for raw bytes, fields are returned as bytes. Lines
+# that need the slow path are decoded and go through parse_line
+def parse_line_bytes(line):
+    parts = line.split(b'"')
+    if len(parts) == 7 and not parts[6].strip():
+        prefix, request, middle, referer, _, ua, _ = parts
+        ip = prefix.partition(b" ")[0]
+        timestamp = prefix[prefix.find(b"[") + 1:prefix.rfind(b"]")]
+        status, _, size = middle.strip().partition(b" ")
+        method, _, rest = request.partition(b" ")
+        path, sep, _ = rest.rpartition(b" ")
+        return ip, timestamp, method, (path if sep else rest), status, size, referer, ua
+    record = parse_line(line.decode("utf-8", errors="replace"))
+    if record is None:
+        return None
+    return tuple(None if value is None else value.encode("utf-8") for value in record)
+
+# Aggregate the selected dimensions while streaming the log, so memory is
+# bounded by the number of distinct keys and not by the size of the file
+def count_records(stream, dims=("ua",), parse=parse_line):
+    counters = {dim: Counter() for dim in dims}
+    keyed = [(counters[dim], FIELDS.index(dim)) for dim in dims if dim in FIELDS and dim != "bytes"]
+    hours = counters.get("hour")
+    sizes = counters.get("bytes")
+    total_bytes = 0
+    lines = 0
+    for line in stream:
+        lines += 1
+        record = parse(line)
+        if record is None:
+            continue
+        for counter, index in keyed:
+            value = record[index]
+            if value is not None:
+                counter[value] += 1
+        if hours is not None and record[1]:
+            # [24/Jul/2019:06:51:05 +0000] -> "06"
+            hours[record[1][12:14]] += 1
+        if sizes is not None and record[5] and record[5].isascii() and record[5].isdigit():
+            total_bytes += int(record[5])
+    if sizes is not None:
+        sizes["total"] = total_bytes
+    return counters, lines
+
+# Count a block of raw lines column by column. Well formed lines are split
+# with list comprehensions and counted with Counter.update (both run in C).
+# A block with an odd line goes through parse_line_bytes line by line, so
+# keys are still first seen in the same order as in the text mode
+def count_block(lines, counters):
+    if list(counters) == ["ua"]:
+        # Only the last quoted field is needed, so split from the end
+        tails = [line.rsplit(b'"', 2) for line in lines]
+        if all(len(p) == 3 and not p[2] for p in tails):
+            counters["ua"].update([p[1] for p in tails])
+            return
+    else:
+        good = [line.split(b'"') for line in lines]
+        if all(len(p) == 7 and not p[6] for p in good):
+            count_columns(good, counters)
+            return
+    merge_counters(counters, count_records(lines, tuple(counters), parse_line_bytes)[0])
+
+# Count the selected dimensions of lines already split on their quotes
+def count_columns(good, counters):
+    if "ua" in counters:
+        counters["ua"].update([p[5] for p in good])
+    if "ip" in counters or "hour" in counters:
+        prefixes = [p[0] for p in good]
+        if "ip" in counters:
+            counters["ip"].update([prefix.partition(b" ")[0] for prefix in prefixes])
+        if "hour" in counters:
+            stamps = [prefix[prefix.find(b"[") + 1:prefix.rfind(b"]")] for prefix in prefixes]
+            counters["hour"].update([stamp[12:14] for stamp in stamps if stamp])
+    if "status" in counters or "bytes" in counters:
+        middles = [p[2].strip().partition(b" ") for p in good]
+        if "status" in counters:
+            counters["status"].update([m[0] for m in middles])
+        if "bytes" in counters:
+            counters["bytes"]["total"] += sum([int(m[2]) for m in middles if m[2].isdigit()])
+    if "method" in counters or "path" in counters:
+        requests = [p[1].partition(b" ") for p in good]
+        if "method" in counters:
+            counters["method"].update([r[0] for r in requests])
+        if "path" in counters:
+            paths = [r[2].rpartition(b" ") for r in requests]
+            counters["path"].update([path[0] if path[1] else request[2] for path, request in zip(paths, requests)])
+
+# Aggregate [start, end) of a plain log scanned as bytes from a memory map.
+# Keys stay bytes until the end, then each distinct key is decoded once
+def count_records_mmap(file, start=0, end=None, dims=("ua",)):
+    counters = {dim: Counter() for dim in dims}
+    if "bytes" in counters:
+        counters["bytes"]["total"] = 0
+    lines = 0
+    for block in read_blocks_mmap(file, start, end):
+        lines += len(block)
+        count_block(block, counters)
+    return decode_counters(counters), lines
+
+# Run a single task: (file, None, None) for a whole log, (file, start, end)
+# for a byte range. Returns partial Counters and the number of lines read.
+# With use_mmap plain logs are scanned as bytes
+def run_task(task, dims=("ua",), use_mmap=False):
+    file, start, end = task
+    if use_mmap and is_splittable(file):
+        return count_records_mmap(file, start or 0, end, dims)
+    if start is None:
+        with open_log(file) as f:
+            return count_records(f, dims)
+    return count_records(read_range(file, start, end), dims)
+
+# Count a task in batches, yielding exact Counters for each batch. Memory
+# is bounded by the batch size, whatever the cardinality of the log
+def iter_batches(task, dims, use_mmap=False):
+    file, start, end = task
+    if use_mmap and is_splittable(file):
+        for block in read_blocks_mmap(file, start or 0, end):
+            counters = {dim: Counter() for dim in dims}
+            count_block(block, counters)
+            yield decode_counters(counters), len(block)
+        return
+    if start is not None:
+        yield from count_batches(read_range(file, start, end), dims)
+        return
+    with open_log(file) as f:
+        yield from count_batches(f, dims)
+
+def count_batches(stream, dims):
+    while True:
+        batch = list(islice(stream, SKETCH_BATCH))
+        if not batch:
+            return
+        yield count_records(batch, dims)
+
+# Sketches for every dimension. Bytes sent is a plain sum and stays exact
+def new_sketches(dims, capacity, precision):
+    return {dim: Counter() if dim == "bytes" else DimensionSketch(capacity, precision) for dim in dims}
+
+# Like run_task but folds the batches into sketches of bounded size
+def run_task_sketched(task, dims=("ua",), use_mmap=False, sketch=(1024, 14)):
+    sketches = new_sketches(dims, *sketch)
+    lines = 0
+    for counters, batch_lines in iter_batches(task, dims, use_mmap):
+        for dim, counter in counters.items():
+            sketches[dim].update(counter)
+        lines += batch_lines
+    return sketches, lines
+
+# Split the logs into tasks. Plain logs bigger than the chunk size are cut
+# into byte ranges when running with more than one job
+def plan_tasks(files, jobs, chunk_size):
+    tasks = []
+    for file in files:
+        if file != "-" and not os.path.exists(file):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), file)
+        if jobs > 1 and is_splittable(file):
+            size = os.path.getsize(file)
+            if size > chunk_size:
+                for start in range(0, size, chunk_size):
+                    tasks.append((file, start, min(start + chunk_size, size)))
+                continue
+        tasks.append((file, None, None))
+    return tasks
+
+# Count all tasks, in a process pool when jobs > 1. Partials are merged in
+# task order, so the first-seen order of the keys (and the output) is the
+# same as a single-threaded run. With sketch=(capacity, precision) the
+# dimensions are counted with mergeable sketches instead of Counters
+def analyze(files, jobs=1, chunk_size=DEFAULT_CHUNK_MB * 1024 * 1024, dims=("ua",), use_mmap=False, sketch=None):
+    tasks = plan_tasks(files, jobs, chunk_size)
+    if sketch:
+        counters = new_sketches(dims, *sketch)
+        worker = partial(run_task_sketched, dims=dims, use_mmap=use_mmap, sketch=sketch)
+    else:
+        counters = {dim: Counter() for dim in dims}
+        worker = partial(run_task, dims=dims, use_mmap=use_mmap)
+    lines = 0
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+            for partial_counters, partial_lines in executor.map(worker, tasks):
+                merge_counters(counters, partial_counters)
+                lines += partial_lines
+    else:
+        for task in tasks:
+            partial_counters, partial_lines = worker(task)
+            merge_counters(counters, partial_counters)
+            lines += partial_lines
+    return counters, lines
+
+def merge_counters(counters, partial_counters):
+    for dim, counter in partial_counters.items():
+        if isinstance(counter, DimensionSketch):
+            counters[dim].merge(counter)
+        else:
+            counters[dim].update(counter)
+
+# Offset just after the last newline of a plain log, so an incremental run
+# never counts a line that is still being written
+def complete_end(file, start, size):
+    with open(file, "rb") as f:
+        end = size
+        while end > start:
+            block = max(start, end - 64 * 1024)
+            f.seek(block)
+            newline = f.read(end - block).rfind(b"\n")
+            if newline >= 0:
+                return block + newline + 1
+            end = block
+    return start
+
+# Look for the file a rotated log was renamed to (access.log -> access.log.1)
+def find_rotated(file, dev, inode):
+    folder = os.path.dirname(file) or "."
+    name = os.path.basename(file)
+    for entry in os.scandir(folder):
+        if entry.name != name and entry.name.startswith(name) and entry.is_file():
+            st = entry.stat()
+            if st.st_dev == dev and st.st_ino == inode:
+                return entry.path
+    return None
+
+# Load the checkpoint of a previous run, or start a new one
+def load_state(state_file, file, dims):
+    state = {"file": os.path.abspath(file), "dev": None, "inode": None, "offset": 0, "lines": 0,
+             "dims": list(dims), "counters": {dim: {} for dim in dims}}
+    if state_file and os.path.exists(state_file):
+        with open(state_file, "r") as f:
+            state = json.load(f)
+        if state["file"] != os.path.abspath(file):
+            raise ValueError(f"state file {state_file} belongs to {state['file']}")
+        if state["dims"] != list(dims):
+            raise ValueError(f"state file {state_file} was created with --by {','.join(state['dims'])}")
+    state["counters"] = {dim: Counter(state["counters"][dim]) for dim in dims}
+    return state
+
+# Write the checkpoint atomically, so a crash never leaves half a state file
+def save_state(state_file, state):
+    tmp = f"{state_file}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_file)
+
+# Count the bytes appended to a plain log since the last checkpoint. Handles
+# logrotate renames (the rest of the old file is read first, then the new
+# one from the start) and copytruncate (the log shrank, start over at 0)
+def update_incremental(file, state, use_mmap=False):
+    dims = tuple(state["dims"])
+    st = os.stat(file)
+    ranges = []
+    if state["inode"] is not None and (st.st_dev, st.st_ino) != (state["dev"], state["inode"]):
+        rotated = find_rotated(file, state["dev"], state["inode"])
+        if rotated and is_splittable(rotated):
+            ranges.append((rotated, state["offset"], os.path.getsize(rotated)))
+        state["offset"] = 0
+    elif st.st_size < state["offset"]:
+        state["offset"] = 0
+    end = complete_end(file, state["offset"], st.st_size)
+    ranges.append((file, state["offset"], end))
+
+    lines = 0
+    for path, start, stop in ranges:
+        if stop <= start:
+            continue
+        partial_counters, partial_lines = run_task((path, start, stop), dims, use_mmap)
+        merge_counters(state["counters"], partial_counters)
+        lines += partial_lines
+    state.update(dev=st.st_dev, inode=st.st_ino, offset=end, lines=state["lines"] + lines)
+    return lines
+
+# Keep counting the lines appended to a log until interrupted
+def follow(file, state, state_file=None, interval=1.0, use_mmap=False, stats=False):
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        while True:
+            try:
+                lines = update_incremental(file, state, use_mmap)
+            except FileNotFoundError:
+                # Rotated and the new log isn't there yet
+                lines = 0
+            if lines:
+                if state_file:
+                    save_state(state_file, state)
+                if stats:
+                    print(f"{lines} new line(s), {state['lines']} total", file=sys.stderr)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+# Print one section per dimension. With a single user agent dimension the
+# output is the same as it always was. Sketched dimensions also print their
+# error bounds and the maximum overestimation of each count
+def print_report(counters, top=None):
+    for dim, counter in counters.items():
+        if len(counters) > 1:
+            print(f"=== {DIMENSIONS[dim]} ===")
+        if dim == "bytes":
+            print(f"{counter['total']} byte(s) sent")
+            continue
+        if isinstance(counter, DimensionSketch):
+            print(f"# {counter.describe()}")
+            for key, count, error in counter.heavy.most_common(top):
+                print(f"{count} request(s) by : {key} (error <= {error})")
+            continue
+        items = counter.most_common(top) if top else counter.items()
+        for key, count in items:
+            print(f"{count} request(s) by : {key}")
+
+# Parse "ua,status,hour" into a tuple of known dimensions
+def parse_dims(value):
+    dims = tuple(dict.fromkeys(dim.strip() for dim in value.split(",") if dim.strip()))
+    unknown = [dim for dim in dims if dim not in DIMENSIONS]
+    if not dims or unknown:
+        raise argparse.ArgumentTypeError(f"invalid dimension(s) {', '.join(unknown)}. Choose from {', '.join(DIMENSIONS)}")
+    return dims
+
+# Parse the lines of the logs as records for logindex.build_index
+def iter_records(files):
+    for file in files:
+        with open_log(file) as f:
+            for line in f:
+                yield parse_line(line)
+
+# "4xx" -> (400, 500), "404" -> (404, 405)
+def parse_status(value):
+    value = value.lower()
+    if len(value) == 3 and value[0].isdigit() and value[1:] == "xx":
+        return int(value[0]) * 100, int(value[0]) * 100 + 100
+    if len(value) == 3 and value.isdigit():
+        return int(value), int(value) + 1
+    raise argparse.ArgumentTypeError(f"invalid status {value}. Use a code (404) or a class (4xx)")
+
+# ISO date and time ("2019-07-24T06:00"), UTC unless it has an offset
+def parse_time(value):
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time {value}. Use YYYY-MM-DDTHH:MM[:SS][+HH:MM]")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp())
+
+# --build-index: parse the logs once into a columnar cache
+def build_index(args):
+    started = time.perf_counter()
+    try:
+        meta = logindex.build_index(iter_records(args.files), args.build_index)
+    except FileNotFoundError as e:
+        print(f"File {e.filename} not found.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error indexing file(s) {', '.join(args.files)}: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+    print(f"Indexed {meta['rows']} request(s) from {meta['lines']} line(s) into {args.build_index} "
+          f"({len(meta['blocks'])} block(s), {elapsed:.3f}s)")
+
+# --index: answer the query from a columnar cache
+def query_index(args):
+    started = time.perf_counter()
+    try:
+        counters, lines, matched = logindex.query_index(args.index, args.by, args.status, args.since, args.until)
+    except FileNotFoundError:
+        print(f"Index {args.index} not found. Create it with --build-index.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error reading index {args.index}: {e}")
+        sys.exit(1)
+
+    # Check if index is empty
+    if not lines:
+        print(f"Index {args.index} is empty.")
+        sys.exit(1)
+
+    if args.stats:
+        elapsed = time.perf_counter() - started
+        print(f"Matched {matched} of {lines} line(s) in {elapsed:.3f}s", file=sys.stderr)
+
+    # Print result analiisis
+    print_report(counters, args.top)
+
+# --state / --follow: resume from the checkpoint, read what is new, save it
+def incremental(args):
+    file = args.files[0]
+    started = time.perf_counter()
+    try:
+        state = load_state(args.state, file, args.by)
+        lines = update_incremental(file, state, args.mmap)
+        if args.state:
+            save_state(args.state, state)
+        if args.stats:
+            elapsed = time.perf_counter() - started
+            print(f"Parsed {lines} new line(s) in {elapsed:.3f}s", file=sys.stderr)
+        if args.follow:
+            follow(file, state, args.state, args.interval, args.mmap, args.stats)
+    except FileNotFoundError as e:
+        print(f"File {e.filename} not found.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error reading file {file}: {e}")
+        sys.exit(1)
+
+    # Check if file is empty
+    if not state["lines"]:
+        print(f"File {file} is empty.")
+        sys.exit(1)
+
+    # Print result analiisis
+    print_report(state["counters"], args.top)
+
+def main():
+    parser = argparse.ArgumentParser(prog="3_LogAnalisis.py",
+                                     description="Get statistics on User Agents and other fields from access logs.")
+    parser.add_argument('files', nargs='*', metavar='filename', help='Log file(s) to analyze, "-" for stdin')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes (0 = all cores)')
+    parser.add_argument('--chunk-mb', type=int, default=DEFAULT_CHUNK_MB, help='Size in MB of the byte ranges given to each worker')
+    parser.add_argument('-b', '--by', type=parse_dims, default=("ua",), help=f'Comma-separated dimensions to aggregate ({", ".join(DIMENSIONS)}). Default: ua')
+    parser.add_argument('-n', '--top', type=int, help='Only print the N most common keys of each dimension')
+    parser.add_argument('--mmap', action='store_true', help='Memory map plain logs and scan them as bytes (faster)')
+    parser.add_argument('--stats', action='store_true', help='Print lines parsed and lines/sec to stderr')
+    parser.add_argument('--sketch', action='store_true', help='Count with Space-Saving and HyperLogLog sketches in bounded memory')
+    parser.add_argument('--sketch-size', type=int, default=1024, help='Space-Saving counters kept per dimension with --sketch (default: 1024)')
+    parser.add_argument('--hll-precision', type=int, default=14, help='HyperLogLog precision (4-16), 2^P registers per dimension (default: 14)')
+    parser.add_argument('--build-index', metavar='INDEX_DIR', help='Parse the logs into a columnar cache for repeat queries')
+    parser.add_argument('--index', metavar='INDEX_DIR', help='Query a columnar cache instead of log files')
+    parser.add_argument('--status', type=parse_status, help='With --index: only count a status code (404) or class (4xx)')
+    parser.add_argument('--since', type=parse_time, help='With --index: only count requests at or after this time (2019-07-24T06:00)')
+    parser.add_argument('--until', type=parse_time, help='With --index: only count requests before this time')
+    parser.add_argument('--state', metavar='STATE_FILE', help='Checkpoint file: only bytes appended since the last run are read')
+    parser.add_argument('-f', '--follow', action='store_true', help='Keep reading new lines until interrupted, then print the report')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --follow (default: 1)')
+    args = parser.parse_args()
+
+    if args.index:
+        if args.files or args.build_index:
+            parser.error("--index reads the cache, don't give log files or --build-index")
+        query_index(args)
+        return
+    if not args.files:
+        parser.error("the following arguments are required: filename")
+    if args.status or args.since is not None or args.until is not None:
+        parser.error("--status, --since and --until need --index")
+    if args.build_index:
+        build_index(args)
+        return
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    if args.chunk_mb <= 0:
+        parser.error("--chunk-mb must be a positive number")
+    if args.top is not None and args.top <= 0:
+        parser.error("--top must be a positive number")
+    if args.files.count("-") > 1:
+        parser.error("stdin (-) can only be given once")
+    if (args.state or args.follow) and (len(args.files) != 1 or not is_splittable(args.files[0])):
+        parser.error("--state and --follow need exactly one plain (uncompressed) log file")
+    if args.sketch and (args.state or args.follow):
+        parser.error("--sketch can't be combined with --state or --follow")
+    if args.sketch_size <= 0:
+        parser.error("--sketch-size must be a positive number")
+    if not 4 <= args.hll_precision <= 16:
+        parser.error("--hll-precision must be between 4 and 16")
+
+    if args.state or args.follow:
+        incremental(args)
+        return
+
+    # Check if files exist and can be read
+    started = time.perf_counter()
+    try:
+        sketch = (args.sketch_size, args.hll_precision) if args.sketch else None
+        counters, lines = analyze(args.files, jobs, args.chunk_mb * 1024 * 1024, args.by, args.mmap, sketch)
+    except FileNotFoundError as e:
+        print(f"File {e.filename} not found.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error reading file(s) {', '.join(args.files)}: {e}")
+        sys.exit(1)
+
+    # Check if files are empty
+    if not lines:
+        print(f"File {', '.join(args.files)} is empty.")
+        sys.exit(1)
+
+    elapsed = time.perf_counter() - started
+    if args.stats:
+        print(f"Parsed {lines} line(s) in {elapsed:.3f}s ({lines / elapsed:.0f} lines/sec)", file=sys.stderr)
+
+    # Print result analiisis
+    print_report(counters, args.top)
+
+if __name__ == "__main__":
+    main()
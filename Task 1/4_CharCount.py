@@ -1,24 +1,337 @@
 #!/usr/bin/env python3
 # Script to count the number of characters in a string
 
+import os
+import re
 import sys
+import codecs
+import argparse
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+import charhist
 
-# Check number of arguments
-if len(sys.argv) != 2:
-    print("Usage: ./4_CharCount.py <string>")
-    sys.exit(1)
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-# Asign string and remove blank spaces
-string = sys.argv[1].strip()
+try:
+    import regex
+except ImportError:
+    regex = None
+
+# Bytes read from a file or stdin at a time
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# Files counted by one task of the --batch worker pool
+BATCH_FILES = 64
+
+# Extended grapheme clusters. The regex module implements the full Unicode
+# rules with \X; without it a cluster is approximated as CRLF, or one
+# character followed by combining marks, variation selectors, emoji
+# modifiers and zero width joiner sequences
+if regex is not None:
+    GRAPHEME_PATTERN = regex.compile(r"\X", regex.DOTALL)
+    JOINING_PATTERN = None
+else:
+    EXTEND = (r"[\u0300-\u036f\u0483-\u0489\u0591-\u05bd\u0610-\u061a\u064b-\u065f\u0900-\u0903"
+              r"\u093a-\u094f\u0e31\u0e34-\u0e3a\u0e47-\u0e4e\u1ab0-\u1aff\u1dc0-\u1dff\u200c\u200d"
+              r"\u20d0-\u20ff\ufe00-\ufe0f\ufe20-\ufe2f\U0001f3fb-\U0001f3ff\U000e0020-\U000e007f"
+              r"\U000e0100-\U000e01ef]")
+    GRAPHEME_PATTERN = re.compile(rf"\r\n|[\U0001f1e6-\U0001f1ff]{{2}}|.(?:\u200d.|{EXTEND})*", re.DOTALL)
+    # Text without any of these characters is one cluster per character
+    JOINING_PATTERN = re.compile(rf"\r|[\U0001f1e6-\U0001f1ff]|{EXTEND}")
 
 #Count characters with Counter
-char_count = Counter()
-for char in string:
-    char_count[char] += 1
+def count_chars(string):
+    return Counter(string)
+
+# --- Files and streams ---
+
+def read_chunks(stream, size=CHUNK_SIZE):
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+# Byte histogram of the chunks: {byte value: count}
+def count_bytes(chunks):
+    if np is not None:
+        totals = np.zeros(256, dtype=np.int64)
+        for chunk in chunks:
+            totals += np.bincount(np.frombuffer(chunk, dtype=np.uint8), minlength=256)
+        return Counter({value: int(count) for value, count in enumerate(totals) if count})
+    counts = Counter()
+    for chunk in chunks:
+        counts.update(chunk)
+    return counts
+
+# Decode UTF-8 chunks into text. The incremental decoder keeps a multi-byte
+# character split between two chunks until its last byte arrives. Invalid
+# bytes become U+FFFD
+def decode_chunks(chunks, casefold=False):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        yield text.casefold() if casefold else text
+    text = decoder.decode(b"", final=True)
+    yield text.casefold() if casefold else text
+
+# Split texts into sequences of grapheme clusters (a plain string when every
+# character is a cluster of its own). The last cluster of a text may
+# continue in the next one (a combining mark, CRLF), so it's held back
+def split_graphemes(texts):
+    held = ""
+    for text in texts:
+        text = held + text
+        if JOINING_PATTERN is not None and not JOINING_PATTERN.search(text):
+            held = text[-1:]
+            yield text[:-1]
+            continue
+        clusters = GRAPHEME_PATTERN.findall(text)
+        held = clusters.pop() if clusters else ""
+        yield clusters
+    if held:
+        yield [held]
+
+# Histogram of single characters. With NumPy the code points are counted
+# with bincount: ASCII text straight from its bytes, the rest as UTF-32
+def count_characters(texts):
+    if np is None:
+        counts = Counter()
+        for text in texts:
+            counts.update(text)
+        return counts
+    totals = np.zeros(128, dtype=np.int64)
+    for text in texts:
+        if text.isascii():
+            codes = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+        else:
+            codes = np.frombuffer(text.encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+        counts = np.bincount(codes)
+        if len(counts) > len(totals):
+            counts[:len(totals)] += totals
+            totals = counts
+        else:
+            totals[:len(counts)] += counts
+    return Counter({chr(code): int(count) for code, count in enumerate(totals) if count})
+
+# Histogram of n-grams of units (characters or grapheme clusters). The last
+# n - 1 units of a text start the n-grams that cross into the next one
+def count_ngrams(units_list, n):
+    counts = Counter()
+    previous = []
+    for units in units_list:
+        units = previous + list(units)
+        counts.update(map("".join, zip(*(units[i:] for i in range(n)))))
+        previous = units[-(n - 1):]
+    return counts
+
+# Count a stream of UTF-8 bytes chunk by chunk
+def count_stream(chunks, casefold=False, graphemes=False, ngram=1):
+    texts = decode_chunks(chunks, casefold)
+    if graphemes and ngram == 1:
+        # Plain strings go through the fast character histogram
+        counts = Counter()
+        def plain_texts():
+            for units in split_graphemes(texts):
+                if isinstance(units, str):
+                    yield units
+                else:
+                    counts.update(units)
+        counts.update(count_characters(plain_texts()))
+        return counts
+    if graphemes:
+        return count_ngrams(split_graphemes(texts), ngram)
+    if ngram > 1:
+        return count_ngrams(texts, ngram)
+    return count_characters(texts)
+
+# Printable form of a key: control characters and undecodable bytes escaped
+def display(key):
+    if isinstance(key, int):
+        return repr(bytes([key]))[2:-1]
+    return key if key.isprintable() or key == " " else repr(key)[1:-1]
+
+# Count one open binary stream in the given mode
+def count_file(stream, use_bytes=False, casefold=False, graphemes=False, ngram=1):
+    chunks = read_chunks(stream)
+    if use_bytes:
+        return count_bytes(chunks)
+    return count_stream(chunks, casefold, graphemes, ngram)
+
+# Most common first, ties in key order so the output is deterministic
+def print_counts(counts, top=None):
+    for key, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top]:
+        print(f"{display(key)}:{count}")
+
+def stream_mode(args):
+    try:
+        if args.file == "-":
+            stream = open(sys.stdin.fileno(), "rb", closefd=False)
+        else:
+            stream = open(args.file, "rb")
+        with stream:
+            counts = count_file(stream, args.bytes, args.casefold, args.graphemes, args.ngram)
+    except FileNotFoundError:
+        print(f"File {args.file} not found.")
+        sys.exit(1)
+
+    print_counts(counts, args.top)
+
+# --- Batch mode ---
+
+# Files to count: files given directly, every file under the directories
+# (in sorted order) and the paths listed one per line in files_from
+def iter_paths(paths, files_from=None):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+    if files_from:
+        if files_from == "-":
+            stream = open(sys.stdin.fileno(), "r", closefd=False)
+        else:
+            stream = open(files_from, "r")
+        with stream:
+            for line in stream:
+                line = line.rstrip("\n")
+                if line:
+                    yield line
+
+def iter_groups(paths, size=BATCH_FILES):
+    paths = iter(paths)
+    while group := list(islice(paths, size)):
+        yield group
+
+# Worker task: histogram of a group of files. Unreadable files are
+# returned as (path, reason) instead of stopping the run
+def count_files(paths, **mode):
+    counts = Counter()
+    files = 0
+    errors = []
+    for path in paths:
+        try:
+            with open(path, "rb") as stream:
+                counts.update(count_file(stream, **mode))
+            files += 1
+        except OSError as e:
+            errors.append((path, e.strerror or str(e)))
+    return counts, files, errors
+
+# Count many files, in a process pool when jobs > 1. The histogram is a sum,
+# so the result doesn't depend on the order the groups finish in
+def count_batch(paths, jobs=1, **mode):
+    worker = partial(count_files, **mode)
+    counts = Counter()
+    files = 0
+    errors = []
+    groups = iter_groups(paths)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(worker, groups)
+            for partial_counts, partial_files, partial_errors in results:
+                counts.update(partial_counts)
+                files += partial_files
+                errors += partial_errors
+    else:
+        for group in groups:
+            partial_counts, partial_files, partial_errors = worker(group)
+            counts.update(partial_counts)
+            files += partial_files
+            errors += partial_errors
+    return counts, files, errors
+
+def batch_mode(args):
+    mode = charhist.make_mode(args.bytes, args.casefold, args.graphemes, args.ngram)
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    try:
+        counts, files, errors = count_batch(iter_paths(args.batch or [], args.files_from), jobs,
+                                            use_bytes=args.bytes, casefold=args.casefold,
+                                            graphemes=args.graphemes, ngram=args.ngram)
+    except FileNotFoundError as e:
+        print(f"File {e.filename} not found.")
+        sys.exit(1)
+    for path, reason in errors:
+        print(f"Skipped {path}: {reason}", file=sys.stderr)
+    print(f"Counted {files} file(s)", file=sys.stderr)
+    if args.save:
+        charhist.write_histogram(args.save, counts, mode, files)
+    else:
+        print_counts(counts, args.top)
+
+def merge_mode(args):
+    try:
+        counts, mode, files = charhist.merge_histograms(args.merge)
+    except FileNotFoundError as e:
+        print(f"File {e.filename} not found.")
+        sys.exit(1)
+    except OSError as e:
+        print(f"Can't merge histograms: {e.filename}: {e.strerror}")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Can't merge histograms: {e}")
+        sys.exit(1)
+    print(f"Merged {len(args.merge)} histogram(s) of {files} file(s), counting {charhist.describe_mode(mode)}", file=sys.stderr)
+    if args.save:
+        charhist.write_histogram(args.save, counts, mode, files)
+    else:
+        print_counts(counts, args.top)
+
+def main():
+    parser = argparse.ArgumentParser(prog="4_CharCount.py",
+                                     description="Count the characters of a string, a file or stdin.")
+    parser.add_argument('string', nargs='?', help='String to count')
+    parser.add_argument('-f', '--file', help='Count a UTF-8 file instead ("-" for stdin), read in chunks')
+    parser.add_argument('--bytes', action='store_true', help='With --file: count bytes instead of characters')
+    parser.add_argument('--casefold', action='store_true', help='With --file: count case-folded characters')
+    parser.add_argument('--graphemes', action='store_true', help='With --file: count grapheme clusters instead of code points')
+    parser.add_argument('--ngram', type=int, default=1, metavar='N', help='With --file: count sequences of N characters (or clusters)')
+    parser.add_argument('-n', '--top', type=int, help='With --file: only print the N most common keys')
+    parser.add_argument('--batch', nargs='+', metavar='PATH', help='Count many files and directory trees into one histogram')
+    parser.add_argument('--files-from', metavar='LIST', help='With --batch: also count the paths listed in LIST, one per line ("-" for stdin)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='With --batch: number of worker processes (0 = all cores)')
+    parser.add_argument('--save', metavar='HISTOGRAM', help='With --batch/--merge: save the histogram to a file instead of printing it')
+    parser.add_argument('--merge', nargs='+', metavar='HISTOGRAM', help='Merge histograms saved with --save')
+    args = parser.parse_args()
+
+    # Check number of arguments
+    batch = args.batch is not None or args.files_from is not None
+    if [args.string is not None, args.file is not None, batch, args.merge is not None].count(True) != 1:
+        print("Usage: ./4_CharCount.py <string> | --file <file|-> | --batch <path> [<path> ...] | --merge <histogram> [<histogram> ...]")
+        sys.exit(1)
+    if args.save and not (batch or args.merge):
+        parser.error("--save needs --batch or --merge")
+    if args.ngram < 1:
+        parser.error("--ngram must be at least 1")
+    if args.bytes and (args.casefold or args.graphemes or args.ngram > 1):
+        parser.error("--bytes can't be combined with --casefold, --graphemes or --ngram")
+
+    if args.file:
+        stream_mode(args)
+        return
+    if batch:
+        batch_mode(args)
+        return
+    if args.merge:
+        merge_mode(args)
+        return
+
+    # Asign string and remove blank spaces
+    string = args.string.strip()
 
-# Print result 
-for char, count in char_count.items():
-    print(f"{char}:{count}", end=" ")
+    char_count = count_chars(string)
 
+    # Print result
+    for char, count in char_count.items():
+        print(f"{char}:{count}", end=" ")
 
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,515 @@
 #!/usr/bin/env python3
 # Script that obtains system info from a Linux system
 
+import os
+import pwd
+import sys
+import json
+import mmap
+import time
+import fcntl
+import socket
+import struct
 import argparse
-import subprocess
-
-parser = argparse.ArgumentParser(prog="5_SysInfo.py",
-                                 description="Get general system information.")
-parser.add_argument('-d', '--distro', action='store_true', help='Get Linux distribution information')
-parser.add_argument('-m', '--memory', action='store_true', help='Get memory information')
-parser.add_argument('-c', '--cpu', action='store_true', help='Get CPU information')
-parser.add_argument('-u', '--user', action='store_true', help='Get user information')
-parser.add_argument('-l', '--load', action='store_true', help='Get load average')
-parser.add_argument('-i', '--ip', action='store_true', help='Get IP address')
-args = parser.parse_args()
-
-# Check if no arguments are provided
-if not any(vars(args).values()):
-    parser.print_help()
-    exit(1)
-
-# Print selected values
-if args.distro:
-    distroInfo = subprocess.check_output('cat /etc/os-release | grep -E "^NAME=" && cat /etc/os-release | grep -E "^VERSION="', shell=True, text=True)
-    print(f'=== DISTRIBUTION INFO ===\n{distroInfo}')
-if args.memory:
-    memoryInfo = subprocess.check_output('free -h', shell=True, text=True)
-    print(f'=== MEMORY INFO ===\n{memoryInfo}')
-if args.cpu:
-    cpuInfo = subprocess.check_output('cat /proc/cpuinfo | grep -E "model name|processor|cpu MHz"', shell=True, text=True)
-    print(f'=== CPU INFO ===\n{cpuInfo}')
-if args.user:
-    userInfo = subprocess.check_output('whoami', shell=True, text=True)
-    print(f'=== USER NAME ===\n{userInfo}')
-if args.load:
-    loadAvg = subprocess.check_output('uptime', shell=True, text=True)
-    print(f'=== LOAD AVERAGE ===\n{loadAvg}')
-if args.ip:
-    ipAddr = subprocess.check_output('hostname -I', shell=True, text=True)
-    print(f'=== IP ADRESS ===\n{ipAddr}')
\ No newline at end of file
+import tempfile
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# ioctl to get the IPv4 address of an interface (linux/sockios.h)
+SIOCGIFADDR = 0x8915
+
+# utmp records (bits/utmp.h): 384 bytes each, ut_type first
+UTMP_FILE = "/var/run/utmp"
+UTMP_RECORD_SIZE = 384
+UTMP_USER_PROCESS = 7
+
+# Ring buffer file header: magic, slot size, number of slots, records written
+RING_MAGIC = b"SIRB"
+RING_HEADER = struct.Struct("<4sIIQ")
+
+# Default ring slot size: room for the memory and load values plus one
+# '"cpuN":100.0,' entry (16 bytes at most) per CPU and the total
+def default_slot_size():
+    size = 256 + 16 * ((os.cpu_count() or 1) + 1)
+    return (size + 63) // 64 * 64
+
+# Sections whose values can't change until the next boot, kept in the snapshot
+STATIC_SECTIONS = ("distro", "cpu")
+
+# --- Readers ---
+# Each reader returns plain data read straight from /proc, /etc or a
+# syscall, so no shell or external command is run
+
+def read_file(path):
+    with open(path, "r") as f:
+        return f.read()
+
+# /etc/os-release as {key: value}
+def read_os_release(path="/etc/os-release"):
+    release = {}
+    for line in read_file(path).splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            release[key] = value.strip().strip('"')
+    return release
+
+# /proc/meminfo as {field: bytes}
+def read_meminfo(path="/proc/meminfo"):
+    info = {}
+    for line in read_file(path).splitlines():
+        key, _, value = line.partition(":")
+        value = value.split()
+        if value:
+            info[key] = int(value[0]) * (1024 if value[1:] == ["kB"] else 1)
+    return info
+
+# /proc/cpuinfo as a list of {field: value}, one per logical processor
+def read_cpuinfo(path="/proc/cpuinfo"):
+    cpus = []
+    for block in read_file(path).split("\n\n"):
+        cpu = {}
+        for line in block.splitlines():
+            key, sep, value = line.partition(":")
+            if sep:
+                cpu[key.strip()] = value.strip()
+        if cpu:
+            cpus.append(cpu)
+    return cpus
+
+def read_boot_id(path="/proc/sys/kernel/random/boot_id"):
+    return read_file(path).strip()
+
+def read_uptime(path="/proc/uptime"):
+    return float(read_file(path).split()[0])
+
+# Number of logged in users (USER_PROCESS records in utmp)
+def count_users(path=UTMP_FILE):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return 0
+    return sum(1 for offset in range(0, len(data) - UTMP_RECORD_SIZE + 1, UTMP_RECORD_SIZE)
+               if struct.unpack_from("<i", data, offset)[0] == UTMP_USER_PROCESS)
+
+# IPv4 address of every interface except loopback, from the interface list
+# and one ioctl per interface
+def read_ipv4_addresses():
+    addresses = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for _, name in socket.if_nameindex():
+            try:
+                request = struct.pack("256s", name.encode()[:15])
+                address = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)[20:24])
+            except OSError:
+                # Interface without an IPv4 address
+                continue
+            if not address.startswith("127."):
+                addresses.append(address)
+    return addresses
+
+# Global IPv6 addresses from /proc/net/if_inet6 (link and host scoped ones
+# are skipped, like hostname -I does)
+def read_ipv6_addresses(path="/proc/net/if_inet6"):
+    addresses = []
+    try:
+        lines = read_file(path).splitlines()
+    except OSError:
+        return addresses
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 6 or int(fields[3], 16) & 0x30:
+            continue
+        addresses.append(socket.inet_ntop(socket.AF_INET6, bytes.fromhex(fields[0])))
+    return addresses
+
+# --- Structured values ---
+# Typed fields for --format json/msgpack: sizes in bytes, times in seconds
+
+def distro_values():
+    release = read_os_release()
+    return {key.lower(): release.get(key) for key in ("NAME", "VERSION", "ID", "VERSION_ID", "PRETTY_NAME")}
+
+def memory_values():
+    info = read_meminfo()
+    total = info["MemTotal"]
+    available = info.get("MemAvailable", info["MemFree"])
+    swap_total, swap_free = info.get("SwapTotal", 0), info.get("SwapFree", 0)
+    return {"total": total, "used": total - available, "free": info["MemFree"],
+            "shared": info.get("Shmem", 0),
+            "buff_cache": info.get("Buffers", 0) + info.get("Cached", 0) + info.get("SReclaimable", 0),
+            "available": available, "swap_total": swap_total, "swap_used": swap_total - swap_free,
+            "swap_free": swap_free}
+
+# Static CPU values: model, logical processors and physical cores
+def cpu_values():
+    cpus = read_cpuinfo()
+    model = next((cpu[key] for cpu in cpus for key in ("model name", "Hardware", "Processor") if key in cpu), None)
+    cores = {(cpu["physical id"], cpu["core id"]) for cpu in cpus if "physical id" in cpu and "core id" in cpu}
+    return {"model": model, "logical": len(cpus), "cores": len(cores) or len(cpus)}
+
+def user_values():
+    entry = pwd.getpwuid(os.geteuid())
+    return {"name": entry.pw_name, "uid": entry.pw_uid}
+
+def load_values():
+    return {"load": [round(value, 2) for value in os.getloadavg()], "uptime": read_uptime(), "users": count_users()}
+
+def ip_values():
+    return {"ipv4": read_ipv4_addresses(), "ipv6": read_ipv6_addresses()}
+
+SECTIONS = {"distro": distro_values, "memory": memory_values, "cpu": cpu_values,
+            "user": user_values, "load": load_values, "ip": ip_values}
+
+# In a directory only the user can write to: $XDG_RUNTIME_DIR, or else
+# ~/.cache/sysinfo (created private when the snapshot is saved)
+def default_snapshot_path():
+    directory = os.environ.get("XDG_RUNTIME_DIR")
+    if not directory:
+        directory = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "sysinfo")
+    return os.path.join(directory, "sysinfo-snapshot.json")
+
+# Static sections from the snapshot file, collected again (and the file
+# rewritten) when it was saved during another boot
+def load_static(snapshot_path):
+    boot_id = read_boot_id()
+    try:
+        with open(snapshot_path, "r") as f:
+            # A file planted by another user could spoof the values
+            if os.fstat(f.fileno()).st_uid == os.geteuid():
+                snapshot = json.load(f)
+                if snapshot.get("boot_id") == boot_id and all(section in snapshot for section in STATIC_SECTIONS):
+                    return snapshot
+    except (OSError, ValueError):
+        pass
+    snapshot = {"boot_id": boot_id}
+    snapshot.update((section, SECTIONS[section]()) for section in STATIC_SECTIONS)
+    try:
+        save_snapshot(snapshot_path, snapshot)
+    except OSError:
+        # The snapshot only saves time, a read-only directory isn't an error
+        pass
+    return snapshot
+
+# Written to a new private file (mkstemp won't follow a planted symlink)
+# that then replaces the snapshot
+def save_snapshot(snapshot_path, snapshot):
+    directory = os.path.dirname(os.path.abspath(snapshot_path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".sysinfo-snapshot-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, snapshot_path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+# {section: values} of the selected sections. Static ones come from the
+# snapshot when snapshot_path is given
+def collect(sections, snapshot_path=None):
+    static = {}
+    if snapshot_path and any(section in STATIC_SECTIONS for section in sections):
+        static = load_static(snapshot_path)
+    return {section: static[section] if section in static else SECTIONS[section]() for section in sections}
+
+# --- Text reports ---
+
+# Bytes -> free -h style size ("5.9Gi", "568Mi", "0B")
+def human_size(size):
+    if size < 1024:
+        return f"{size}B"
+    for exponent, unit in enumerate(("Ki", "Mi", "Gi", "Ti", "Pi"), 1):
+        value = size / 1024 ** exponent
+        if len(f"{value:.1f}") <= 3:
+            return f"{value:.1f}{unit}"
+        if len(str(int(value))) <= 3 or unit == "Pi":
+            return f"{int(value)}{unit}"
+
+# "29 min", "2:05", "3 days, 2:05", like uptime
+def format_uptime(seconds):
+    minutes = int(seconds) // 60
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    text = f"{days} day{'s' if days != 1 else ''}, " if days else ""
+    return text + (f"{hours}:{minutes:02d}" if hours else f"{minutes} min")
+
+def get_distro_info():
+    release = read_os_release()
+    return "".join(f'{key}="{release[key]}"\n' for key in ("NAME", "VERSION") if key in release)
+
+def get_memory_info():
+    memory = memory_values()
+    rows = [
+        ("", ("total", "used", "free", "shared", "buff/cache", "available")),
+        ("Mem:", [human_size(memory[key]) for key in ("total", "used", "free", "shared", "buff_cache", "available")]),
+        ("Swap:", [human_size(memory[key]) for key in ("swap_total", "swap_used", "swap_free")]),
+    ]
+    return "".join(f"{label:<8}" + "".join(f"{value:>12}" for value in values) + "\n" for label, values in rows)
+
+def get_cpu_info():
+    keys = ("processor", "model name", "cpu MHz")
+    return "".join(line + "\n" for line in read_file("/proc/cpuinfo").splitlines()
+                   if line.partition(":")[0].strip() in keys)
+
+def get_user_info():
+    return pwd.getpwuid(os.geteuid()).pw_name + "\n"
+
+def get_load_average():
+    users = count_users()
+    load = ", ".join(f"{value:.2f}" for value in os.getloadavg())
+    return (f" {time.strftime('%H:%M:%S')} up {format_uptime(read_uptime())},  "
+            f"{users} user{'s' if users > 1 else ''},  load average: {load}\n")
+
+def get_ip_address():
+    return "".join(f"{address} " for address in read_ipv4_addresses() + read_ipv6_addresses()) + "\n"
+
+# --- Watch mode ---
+
+# Samples memory, CPU and load from /proc files that are opened once and
+# re-read with os.pread, so a sample costs a few syscalls and no fork, open
+# or interpreter start. CPU utilisation is the delta of /proc/stat jiffies
+# since the previous sample
+class ProcSampler:
+    FILES = {"memory": "/proc/meminfo", "cpu": "/proc/stat", "load": "/proc/loadavg"}
+
+    def __init__(self, sections=("memory", "cpu", "load")):
+        self.sections = sections
+        self.fds = {section: os.open(self.FILES[section], os.O_RDONLY) for section in sections}
+        self.buffer_size = 65536
+        self.previous = None
+        if "cpu" in sections:
+            self.previous = self.read_cpu_times()
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+
+    def read(self, section):
+        while True:
+            data = os.pread(self.fds[section], self.buffer_size, 0)
+            if len(data) < self.buffer_size:
+                return data
+            self.buffer_size *= 2
+
+    # {"cpu": (busy, total), "cpu0": ...} in jiffies. Idle and iowait are
+    # idle time; guest time is already counted in user and nice
+    def read_cpu_times(self):
+        times = {}
+        for line in self.read("cpu").split(b"\n"):
+            if not line.startswith(b"cpu"):
+                break
+            name, *values = line.split()
+            values = [int(value) for value in values[:8]]
+            total = sum(values)
+            times[name.decode()] = (total - values[3] - values[4], total)
+        return times
+
+    def sample(self):
+        record = {"time": round(time.time(), 3)}
+        if "memory" in self.sections:
+            info = {}
+            for line in self.read("memory").split(b"\n"):
+                key, _, value = line.partition(b":")
+                if key in (b"MemTotal", b"MemFree", b"MemAvailable", b"SwapTotal", b"SwapFree"):
+                    info[key.decode()] = int(value.split()[0]) * 1024
+            available = info.get("MemAvailable", info["MemFree"])
+            record["memory"] = {"total": info["MemTotal"], "used": info["MemTotal"] - available,
+                                "available": available, "swap_used": info["SwapTotal"] - info["SwapFree"]}
+        if "cpu" in self.sections:
+            current = self.read_cpu_times()
+            usage = {}
+            for name, (busy, total) in current.items():
+                last_busy, last_total = self.previous.get(name, (0, 0))
+                elapsed = total - last_total
+                usage[name] = round(100 * (busy - last_busy) / elapsed, 1) if elapsed > 0 else 0.0
+            self.previous = current
+            record["cpu"] = usage
+        if "load" in self.sections:
+            record["load"] = [float(value) for value in self.read("load").split()[:3]]
+        return record
+
+# Fixed-size file holding the last `slots` records, each padded to
+# `slot_size` bytes. The header counts the records written, so a reader
+# knows which slot is the oldest. Reopening a ring with the same geometry
+# continues after its last record. Only a new or empty file is set up as a
+# ring: any other file raises ValueError rather than being overwritten
+class RingBuffer:
+    def __init__(self, path, slot_size=None, slots=3600):
+        slot_size = slot_size or default_slot_size()
+        size = RING_HEADER.size + slot_size * slots
+        self.file = open(path, "a+b")
+        try:
+            written = self.check(path, slot_size, slots, size)
+        except BaseException:
+            self.file.close()
+            raise
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.slot_size, self.slots, self.written = slot_size, slots, written
+        RING_HEADER.pack_into(self.map, 0, RING_MAGIC, slot_size, slots, written)
+
+    # Records already in the file (0 for an empty one)
+    def check(self, path, slot_size, slots, size):
+        file_size = os.fstat(self.file.fileno()).st_size
+        if not file_size:
+            return 0
+        self.file.seek(0)
+        header = self.file.read(RING_HEADER.size)
+        if len(header) < RING_HEADER.size or header[:4] != RING_MAGIC:
+            raise ValueError(f"{path} exists and is not a ring buffer file")
+        _, old_slot_size, old_slots, written = RING_HEADER.unpack(header)
+        if file_size != RING_HEADER.size + old_slot_size * old_slots:
+            raise ValueError(f"{path} is a truncated ring buffer file")
+        if (old_slot_size, old_slots) != (slot_size, slots):
+            raise ValueError(f"{path} holds {old_slots} slots of {old_slot_size} bytes, "
+                             "pass the same --ring-slots and --ring-slot-size or use a new file")
+        return written
+
+    def write(self, record):
+        if len(record) > self.slot_size:
+            raise ValueError(f"record of {len(record)} bytes doesn't fit in a {self.slot_size} byte slot")
+        offset = RING_HEADER.size + (self.written % self.slots) * self.slot_size
+        self.map[offset:offset + self.slot_size] = record.ljust(self.slot_size, b"\0")
+        self.written += 1
+        RING_HEADER.pack_into(self.map, 0, RING_MAGIC, self.slot_size, self.slots, self.written)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+# Records of a ring buffer file, oldest first
+def read_ring(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < RING_HEADER.size:
+        raise ValueError(f"{path} is not a ring buffer file")
+    magic, slot_size, slots, written = RING_HEADER.unpack_from(data)
+    if magic != RING_MAGIC or not slot_size or not slots:
+        raise ValueError(f"{path} is not a ring buffer file")
+    if len(data) < RING_HEADER.size + slot_size * slots:
+        raise ValueError(f"{path} is truncated")
+    for index in range(max(0, written - slots), written):
+        offset = RING_HEADER.size + (index % slots) * slot_size
+        yield data[offset:offset + slot_size].rstrip(b"\0")
+
+# Sample every `interval` seconds until interrupted (or `count` samples).
+# Samples are scheduled on a fixed clock, so the time spent sampling
+# doesn't add up as drift
+def watch(interval, sections, ring=None, count=None):
+    sampler = ProcSampler(sections)
+    written = 0
+    next_sample = time.monotonic()
+    try:
+        while count is None or written < count:
+            next_sample += interval
+            time.sleep(max(0.0, next_sample - time.monotonic()))
+            line = json.dumps(sampler.sample(), separators=(",", ":")).encode()
+            if ring is not None:
+                ring.write(line)
+            else:
+                sys.stdout.buffer.write(line + b"\n")
+                sys.stdout.flush()
+            written += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sampler.close()
+        if ring is not None:
+            ring.close()
+
+def main():
+    parser = argparse.ArgumentParser(prog="5_SysInfo.py",
+                                     description="Get general system information.")
+    parser.add_argument('-d', '--distro', action='store_true', help='Get Linux distribution information')
+    parser.add_argument('-m', '--memory', action='store_true', help='Get memory information')
+    parser.add_argument('-c', '--cpu', action='store_true', help='Get CPU information')
+    parser.add_argument('-u', '--user', action='store_true', help='Get user information')
+    parser.add_argument('-l', '--load', action='store_true', help='Get load average')
+    parser.add_argument('-i', '--ip', action='store_true', help='Get IP address')
+    parser.add_argument('--format', choices=('text', 'json', 'msgpack'), default='text', help='Output format (default: text). json/msgpack print typed values of the selected sections, all of them if none is selected')
+    parser.add_argument('--snapshot', metavar='FILE', default=default_snapshot_path(), help='With --format json/msgpack: cache of the values that are static until reboot (distro, CPU model and count), keyed by the boot id (default: %(default)s)')
+    parser.add_argument('--no-snapshot', action='store_true', help='With --format json/msgpack: always read the static values')
+    parser.add_argument('--watch', type=float, metavar='INTERVAL', help='Sample memory, CPU and load every INTERVAL seconds as JSON lines (-m/-c/-l select the sections)')
+    parser.add_argument('--count', type=int, help='With --watch: stop after COUNT samples')
+    parser.add_argument('--ring', metavar='FILE', help='With --watch: write the samples into a fixed-size ring buffer file instead of stdout')
+    parser.add_argument('--ring-slots', type=int, default=3600, help='With --ring: number of samples kept (default: 3600)')
+    parser.add_argument('--ring-slot-size', type=int, default=default_slot_size(), help='With --ring: bytes per sample (default: %(default)s, from the number of CPUs)')
+    parser.add_argument('--dump-ring', metavar='FILE', help='Print the samples of a ring buffer file as JSON lines, oldest first')
+    args = parser.parse_args()
+
+    if args.dump_ring:
+        try:
+            for record in read_ring(args.dump_ring):
+                print(record.decode())
+        except FileNotFoundError:
+            print(f"File {args.dump_ring} not found.")
+            sys.exit(1)
+        except ValueError as e:
+            print(f"Can't read ring buffer: {e}")
+            sys.exit(1)
+        return
+
+    selected = [section for section in SECTIONS if getattr(args, section)]
+    if args.format != "text" and args.watch is None:
+        if args.format == "msgpack" and msgpack is None:
+            print("msgpack is not installed (pip install msgpack), use --format json instead.")
+            sys.exit(1)
+        values = collect(selected or list(SECTIONS), None if args.no_snapshot else args.snapshot)
+        if args.format == "json":
+            print(json.dumps(values))
+        else:
+            sys.stdout.buffer.write(msgpack.packb(values))
+        return
+
+    if args.watch is not None:
+        if args.format != "text":
+            parser.error("--watch always prints JSON lines, --format doesn't apply")
+        if args.watch <= 0:
+            parser.error("--watch INTERVAL must be positive")
+        if args.distro or args.user or args.ip:
+            parser.error("--watch only samples memory (-m), CPU (-c) and load (-l)")
+        sections = [section for section, selected in (("memory", args.memory), ("cpu", args.cpu), ("load", args.load)) if selected]
+        if args.ring and (args.ring_slots < 1 or args.ring_slot_size < 1):
+            parser.error("--ring-slots and --ring-slot-size must be at least 1")
+        ring = None
+        if args.ring:
+            try:
+                ring = RingBuffer(args.ring, args.ring_slot_size, args.ring_slots)
+            except ValueError as e:
+                print(f"Can't use ring buffer: {e}")
+                sys.exit(1)
+            except OSError as e:
+                print(f"Can't open {args.ring}: {e.strerror}")
+                sys.exit(1)
+        try:
+            watch(args.watch, sections or ["memory", "cpu", "load"], ring, args.count)
+        except ValueError as e:
+            print(f"Error writing ring buffer {args.ring}: {e}")
+            sys.exit(1)
+        return
+
+    # Check if no arguments are provided
+    if not selected:
+        parser.print_help()
+        exit(1)
+
+    # Print selected values
+    if args.distro:
+        print(f'=== DISTRIBUTION INFO ===\n{get_distro_info()}')
+    if args.memory:
+        print(f'=== MEMORY INFO ===\n{get_memory_info()}')
+    if args.cpu:
+        print(f'=== CPU INFO ===\n{get_cpu_info()}')
+    if args.user:
+        print(f'=== USER NAME ===\n{get_user_info()}')
+    if args.load:
+        print(f'=== LOAD AVERAGE ===\n{get_load_average()}')
+    if args.ip:
+        print(f'=== IP ADRESS ===\n{get_ip_address()}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# Benchmark and profiling harness for the Task 1 scripts. Generates
+# synthetic inputs of several sizes, runs each case in a fresh process and
+# reports throughput, the peak RSS of the code under test and (optionally)
+# the cProfile hot spots
+
+import os
+import io
+import sys
+import time
+import pstats
+import random
+import string
+import cProfile
+import argparse
+import resource
+import tempfile
+import importlib.util
+import multiprocessing
+from queue import Empty
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Default sizes are small enough for a quick run; pass bigger ones with
+# --log-sizes 1M,100M,1G,10G --string-sizes 1K,1M,1G --list-sizes 1K,1M,100M
+DEFAULT_LOG_SIZES = "1M,10M"
+DEFAULT_STRING_SIZES = "1K,1M"
+DEFAULT_LIST_SIZES = "1K,1M"
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/76.0.3809.100 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:45.0) Gecko/20100101 Firefox/45.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 12_3_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+    "python-requests/2.22.0",
+    "curl/7.64.0",
+    "Mozilla/5.0",
+    "-",
+]
+METHODS = ["GET", "GET", "GET", "POST", "HEAD"]
+STATUSES = ["200", "200", "200", "301", "304", "400", "404", "502"]
+
+# Load a Task 1 script (their names start with a digit, so they can't be
+# imported with a plain import statement)
+def load_script(filename):
+    name = os.path.splitext(filename)[0].replace("_", "").lower()
+    spec = importlib.util.spec_from_file_location(f"task1_{name}", os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# "10M" -> 10 * 1024 ** 2 (or 10 * 1000 ** 2 with base=1000)
+def parse_size(value, base=1024):
+    value = value.strip().upper().rstrip("B")
+    units = {"K": base, "M": base ** 2, "G": base ** 3}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value))
+
+def format_size(size, base=1024):
+    for unit in ("", "K", "M", "G"):
+        if size < base or unit == "G":
+            return f"{size:g}{unit}" if unit else str(size)
+        size /= base
+
+# --- Synthetic inputs ---
+
+# Write a combined-log-format file of about `size` bytes
+def generate_log(path, size, seed=0):
+    rng = random.Random(seed)
+    ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}" for _ in range(5000)]
+    paths = ["/"] + [f"/{rng.choice(['api', 'static', 'wp-admin', 'cgi-bin'])}/{rng.getrandbits(24):x}" for _ in range(2000)]
+    written = 0
+    with open(path, "w") as f:
+        while written < size:
+            lines = []
+            for _ in range(10000):
+                hour, minute, second = rng.randrange(24), rng.randrange(60), rng.randrange(60)
+                lines.append(f'{rng.choice(ips)} - - [24/Jul/2019:{hour:02d}:{minute:02d}:{second:02d} +0000] '
+                             f'"{rng.choice(METHODS)} {rng.choice(paths)} HTTP/1.1" {rng.choice(STATUSES)} '
+                             f'{rng.randint(0, 50000)} "-" "{rng.choice(USER_AGENTS)}"\n')
+            chunk = "".join(lines)
+            f.write(chunk)
+            written += len(chunk)
+
+def generate_string(size, seed=0):
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + " .,;!?áéíóúñ"
+    block = "".join(rng.choices(alphabet, k=min(size, 1 << 20)))
+    return (block * (size // len(block) + 1))[:size]
+
+def generate_list(count, seed=0):
+    rng = random.Random(seed)
+    return [rng.randrange(count // 2 + 1) for _ in range(count)]
+
+# --- Cases ---
+# Each case prepares its input and returns the function to time, the
+# amount of work it does and the unit of that work
+
+def prepare_log(path, mode):
+    analyzer = load_script("3_LogAnalisis.py")
+    dims = ("ua",) if mode in ("text", "mmap") else tuple(analyzer.DIMENSIONS)
+    run = lambda: analyzer.analyze([path], dims=dims, use_mmap=mode.startswith("mmap"))
+    return run, os.path.getsize(path), "B"
+
+def prepare_charcount(size):
+    text = generate_string(size)
+    count_chars = load_script("4_CharCount.py").count_chars
+    return lambda: count_chars(text), size, "chars"
+
+def prepare_dedup(count):
+    values = generate_list(count)
+    remove_duplicates = load_script("2_RemoveDuplicates.py").remove_duplicates
+    return lambda: remove_duplicates(values), count, "items"
+
+def prepare_dedup_chunks(count):
+    dedup = load_script("2_RemoveDuplicates.py")
+    values = dedup.to_chunk(generate_list(count))
+    step = dedup.DEFAULT_CHUNK
+    return lambda: dedup.dedup_chunks(values[i:i + step] for i in range(0, len(values), step)), count, "items"
+
+CASES = {
+    "log-text": lambda size, path: prepare_log(path, "text"),
+    "log-mmap": lambda size, path: prepare_log(path, "mmap"),
+    "log-all-dims": lambda size, path: prepare_log(path, "mmap-all"),
+    "charcount": lambda size, path: prepare_charcount(size),
+    "dedup": lambda size, path: prepare_dedup(size),
+    "dedup-chunks": lambda size, path: prepare_dedup_chunks(size),
+}
+
+# --- Memory ---
+# The input of a case can be far bigger than what the code under test
+# allocates, so memory is measured from the end of the preparation: the
+# kernel's peak RSS is reset there (Linux 4.0+) and the RSS at that point
+# subtracted from the peak of the run
+
+def current_rss():
+    with open("/proc/self/statm", "r") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+# Returns False if the peak can't be reset; ru_maxrss then still includes
+# the preparation and the delta may be too low
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss():
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Run one case in this (child) process and send back the measurements
+def run_case(case, size, path, profile, queue):
+    run, work, unit = CASES[case](size, path)
+    baseline = current_rss()
+    exact = reset_peak_rss()
+    profiler = cProfile.Profile() if profile else None
+    started = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    run()
+    if profiler:
+        profiler.disable()
+    elapsed = time.perf_counter() - started
+    rss = max(0, peak_rss() - baseline)
+    hot_spots = None
+    if profiler:
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("tottime").print_stats(profile)
+        hot_spots = out.getvalue()
+    queue.put((work, unit, elapsed, rss, exact, hot_spots))
+
+# Each case runs in a freshly spawned interpreter so its memory isn't
+# polluted by previous cases
+def measure(case, size, path=None, profile=0):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(case, size, path, profile, queue))
+    process.start()
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"case {case} exited with code {process.exitcode}")
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmark.py",
+                                     description="Benchmark the Task 1 scripts on synthetic inputs.")
+    parser.add_argument('cases', nargs='*', metavar='case',
+                        help=f'Cases to run ({", ".join(CASES)}). Default: all')
+    parser.add_argument('--log-sizes', default=DEFAULT_LOG_SIZES, help=f'Log sizes in bytes (default: {DEFAULT_LOG_SIZES})')
+    parser.add_argument('--string-sizes', default=DEFAULT_STRING_SIZES, help=f'String sizes in characters (default: {DEFAULT_STRING_SIZES})')
+    parser.add_argument('--list-sizes', default=DEFAULT_LIST_SIZES, help=f'Integer list lengths, K/M/G are powers of 1000 (default: {DEFAULT_LIST_SIZES})')
+    parser.add_argument('--profile', type=int, default=0, metavar='N', help='Print the N hottest functions of each case (cProfile)')
+    parser.add_argument('--workdir', help='Directory for the generated logs (default: a temporary directory)')
+    args = parser.parse_args()
+
+    cases = args.cases or list(CASES)
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s) {', '.join(unknown)}. Choose from {', '.join(CASES)}")
+    try:
+        sizes = {
+            "log": [parse_size(size) for size in args.log_sizes.split(",")],
+            "charcount": [parse_size(size) for size in args.string_sizes.split(",")],
+            "dedup": [parse_size(size, 1000) for size in args.list_sizes.split(",")],
+        }
+    except ValueError as e:
+        parser.error(f"invalid size: {e}")
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        print(f"{'case':<14} {'size':>8} {'seconds':>9} {'throughput':>20} {'run RSS':>10}")
+        logs = {}
+        for case in cases:
+            for size in sizes[case.split("-")[0]]:
+                path = None
+                if case.startswith("log"):
+                    path = logs.get(size)
+                    if path is None:
+                        path = logs[size] = os.path.join(workdir, f"access-{size}.log")
+                        generate_log(path, size)
+                work, unit, elapsed, rss, exact, hot_spots = measure(case, size, path, args.profile)
+                rate = work / elapsed if elapsed else float("inf")
+                throughput = f"{rate / 1024 ** 2:.1f} MB/s" if unit == "B" else f"{rate:,.0f} {unit}/s"
+                print(f"{case:<14} {format_size(size, 1000 if case.startswith('dedup') else 1024):>8} {elapsed:>9.3f} {throughput:>20} {rss / 1024 ** 2:>8.1f}MB{'' if exact else '?'}")
+                if hot_spots:
+                    print(hot_spots)
+
+if __name__ == "__main__":
+    main()
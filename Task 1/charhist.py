@@ -0,0 +1,119 @@
+# Compact binary file format for the partial histograms written by
+# 4_CharCount.py --batch --save and combined with --merge
+#
+# Layout of a histogram file:
+#   magic              b"CHST" and a version byte
+#   header             varints: mode flags, n-gram size, files counted,
+#                      number of keys
+#   body               zlib compressed (key, count) pairs sorted by key:
+#                      varint key length, key bytes (UTF-8 text or one
+#                      byte in byte mode), varint count
+# Keys are always written in sorted order, so the same counts give the same
+# file no matter in which order partials were merged
+
+import zlib
+from collections import Counter
+
+MAGIC = b"CHST"
+VERSION = 1
+
+# Mode flags
+BYTES = 1
+CASEFOLD = 2
+GRAPHEMES = 4
+
+# Unsigned LEB128 integers
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("truncated histogram")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+# Mode of a histogram as (flags, ngram)
+def make_mode(use_bytes=False, casefold=False, graphemes=False, ngram=1):
+    flags = (BYTES if use_bytes else 0) | (CASEFOLD if casefold else 0) | (GRAPHEMES if graphemes else 0)
+    return flags, ngram
+
+def describe_mode(mode):
+    flags, ngram = mode
+    names = [name for flag, name in ((BYTES, "bytes"), (CASEFOLD, "casefold"), (GRAPHEMES, "graphemes")) if flags & flag]
+    if ngram > 1:
+        names.append(f"{ngram}-grams")
+    return ", ".join(names) or "characters"
+
+def encode_histogram(counts, mode, files):
+    flags, ngram = mode
+    header = bytearray(MAGIC)
+    header.append(VERSION)
+    for value in (flags, ngram, files, len(counts)):
+        write_varint(header, value)
+    body = bytearray()
+    for key in sorted(counts):
+        raw = bytes([key]) if flags & BYTES else key.encode("utf-8", errors="surrogatepass")
+        write_varint(body, len(raw))
+        body += raw
+        write_varint(body, counts[key])
+    return bytes(header) + zlib.compress(bytes(body), 6)
+
+# -> (counts, mode, files)
+def decode_histogram(data):
+    if data[:4] != MAGIC:
+        raise ValueError("not a character histogram")
+    if len(data) < 5:
+        raise ValueError("truncated histogram")
+    if data[4] != VERSION:
+        raise ValueError(f"unsupported histogram version {data[4]}")
+    pos = 5
+    flags, pos = read_varint(data, pos)
+    ngram, pos = read_varint(data, pos)
+    files, pos = read_varint(data, pos)
+    size, pos = read_varint(data, pos)
+    try:
+        body = zlib.decompress(data[pos:])
+    except zlib.error as e:
+        raise ValueError(f"corrupted histogram ({e})")
+    counts = Counter()
+    pos = 0
+    for _ in range(size):
+        length, pos = read_varint(body, pos)
+        raw = body[pos:pos + length]
+        if len(raw) != length:
+            raise ValueError("truncated histogram")
+        if flags & BYTES and length != 1:
+            raise ValueError("corrupted histogram (a byte key must be 1 byte long)")
+        pos += length
+        count, pos = read_varint(body, pos)
+        counts[raw[0] if flags & BYTES else raw.decode("utf-8", errors="surrogatepass")] = count
+    return counts, (flags, ngram), files
+
+def write_histogram(path, counts, mode, files):
+    with open(path, "wb") as f:
+        f.write(encode_histogram(counts, mode, files))
+
+def read_histogram(path):
+    with open(path, "rb") as f:
+        return decode_histogram(f.read())
+
+# Sum histogram files. They must all have been counted in the same mode
+def merge_histograms(paths):
+    total, mode, total_files = Counter(), None, 0
+    for path in paths:
+        counts, file_mode, files = read_histogram(path)
+        if mode is not None and file_mode != mode:
+            raise ValueError(f"{path} counts {describe_mode(file_mode)}, the others count {describe_mode(mode)}")
+        mode = file_mode
+        total.update(counts)
+        total_files += files
+    return total, mode, total_files
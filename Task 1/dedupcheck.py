@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# Regression check of the chunked text reader of 2_RemoveDuplicates.py.
+# Every input is read with blocks of every size from 1 byte up, so a block
+# boundary falls right after every character (each separator included),
+# and the integers must come out the same as when read in one block.
+# Exits with 1 on any difference.
+#   ./dedupcheck.py
+
+import os
+import io
+import sys
+import importlib.util
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Inputs and the integers they hold
+CASES = [
+    (b"[1,22] [3]", [1, 22, 3]),
+    (b"[1,22][3]", [1, 22, 3]),
+    (b"10 20\n30\t40,50]60[70", [10, 20, 30, 40, 50, 60, 70]),
+    (b"[-5, 123456789, -42]\n[7,8]\n", [-5, 123456789, -42, 7, 8]),
+    (b"  ,,[[ 99 ]], ", [99]),
+]
+
+def load_dedup():
+    spec = importlib.util.spec_from_file_location("task1_removeduplicates", os.path.join(HERE, "2_RemoveDuplicates.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# A stream returning at most `size` bytes per read, like a pipe can
+class ShortReads(io.RawIOBase):
+    def __init__(self, data, size):
+        self.data, self.size, self.pos = data, size, 0
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        n = self.size if n < 0 else min(n, self.size)
+        block = self.data[self.pos:self.pos + n]
+        self.pos += len(block)
+        return block
+
+def main():
+    dedup = load_dedup()
+    errors = 0
+    for text, expected in CASES:
+        for size in range(1, len(text) + 1):
+            values = [int(value) for part in dedup.read_text_chunks(ShortReads(text, size), 1) for value in part]
+            if values != expected:
+                print(f"{text!r} read {size} byte(s) at a time: got {values}, expected {expected}", file=sys.stderr)
+                errors += 1
+    if errors:
+        print(f"FAILED: {errors} error(s)")
+        sys.exit(1)
+    print(f"OK: {len(CASES)} inputs read with every block size")
+
+if __name__ == "__main__":
+    main()
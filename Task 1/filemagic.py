@@ -0,0 +1,162 @@
+# Content sniffing used by 1_FileExtension.py --sniff. The type of a file is
+# detected from its first bytes ("magic numbers") with a prefix trie of
+# signatures, and results are kept in an LRU cache keyed by the file
+# identity (device, inode, mtime, size) that can be saved between runs
+
+import os
+import json
+import threading
+from collections import OrderedDict
+
+# Bytes read from the start of every file (the tar signature is at 257)
+HEADER_SIZE = 512
+
+# Type -> (signatures, extensions the type is usually saved with). A
+# signature is a tuple of (offset, bytes) parts; bytes between the parts
+# can be anything
+SIGNATURES = {
+    "png": ([((0, b"\x89PNG\r\n\x1a\n"),)], ("png",)),
+    "jpg": ([((0, b"\xff\xd8\xff"),)], ("jpg", "jpeg", "jpe", "jfif")),
+    "gif": ([((0, b"GIF87a"),), ((0, b"GIF89a"),)], ("gif",)),
+    "bmp": ([((0, b"BM"),)], ("bmp", "dib")),
+    "tiff": ([((0, b"II*\x00"),), ((0, b"MM\x00*"),)], ("tiff", "tif")),
+    "ico": ([((0, b"\x00\x00\x01\x00"),)], ("ico",)),
+    "webp": ([((0, b"RIFF"), (8, b"WEBP"))], ("webp",)),
+    "wav": ([((0, b"RIFF"), (8, b"WAVE"))], ("wav",)),
+    "avi": ([((0, b"RIFF"), (8, b"AVI "))], ("avi",)),
+    "mp4": ([((4, b"ftyp"),)], ("mp4", "m4a", "m4v", "mov", "3gp", "heic")),
+    "mp3": ([((0, b"ID3"),), ((0, b"\xff\xfb"),)], ("mp3",)),
+    "ogg": ([((0, b"OggS"),)], ("ogg", "oga", "ogv", "opus")),
+    "flac": ([((0, b"fLaC"),)], ("flac",)),
+    "pdf": ([((0, b"%PDF-"),)], ("pdf",)),
+    "zip": ([((0, b"PK\x03\x04"),), ((0, b"PK\x05\x06"),)],
+            ("zip", "jar", "war", "apk", "whl", "docx", "xlsx", "pptx", "odt", "ods", "odp", "epub")),
+    "gz": ([((0, b"\x1f\x8b"),)], ("gz", "tar.gz", "tgz")),
+    "bz2": ([((0, b"BZh"),)], ("bz2", "tar.bz2", "tbz2")),
+    "xz": ([((0, b"\xfd7zXZ\x00"),)], ("xz", "tar.xz", "txz")),
+    "zst": ([((0, b"\x28\xb5\x2f\xfd"),)], ("zst", "tar.zst")),
+    "7z": ([((0, b"7z\xbc\xaf\x27\x1c"),)], ("7z",)),
+    "rar": ([((0, b"Rar!\x1a\x07"),)], ("rar",)),
+    "tar": ([((257, b"ustar"),)], ("tar",)),
+    "elf": ([((0, b"\x7fELF"),)], ("", "so", "o", "bin", "elf")),
+    "exe": ([((0, b"MZ"),)], ("exe", "dll", "sys", "efi")),
+    "class": ([((0, b"\xca\xfe\xba\xbe"),)], ("class",)),
+    "wasm": ([((0, b"\x00asm"),)], ("wasm",)),
+    "sqlite": ([((0, b"SQLite format 3\x00"),)], ("sqlite", "sqlite3", "db")),
+    "xml": ([((0, b"<?xml"),)], ("xml", "svg", "xhtml", "rss", "plist")),
+    "html": ([((0, b"<!DOCTYPE html"),), ((0, b"<!doctype html"),), ((0, b"<html"),)], ("html", "htm")),
+    "script": ([((0, b"#!"),)], ("", "sh", "bash", "py", "pl", "rb")),
+}
+
+# Trie keys: a byte value, ANY for a byte that can be anything and MATCH
+# for the type of a signature that ends at that node
+ANY = -1
+MATCH = -2
+
+# One trie per offset the signatures start at ({offset: trie}), so a
+# signature deep into the header doesn't cost a chain of ANY nodes
+def build_tries(signatures=SIGNATURES):
+    tries = {}
+    for name, (patterns, _) in signatures.items():
+        for parts in patterns:
+            start = parts[0][0]
+            node = tries.setdefault(start, {})
+            position = start
+            for offset, magic in parts:
+                for _ in range(offset - position):
+                    node = node.setdefault(ANY, {})
+                for byte in magic:
+                    node = node.setdefault(byte, {})
+                position = offset + len(magic)
+            node[MATCH] = name
+    return tries
+
+TRIES = build_tries()
+
+# Type of the longest signature found in the header, or None. Every byte is
+# looked up once per live branch (exact byte and ANY)
+def detect_type(header, tries=TRIES):
+    best, best_length = None, -1
+    stack = [(trie, offset) for offset, trie in tries.items()]
+    while stack:
+        node, position = stack.pop()
+        if MATCH in node and position > best_length:
+            best, best_length = node[MATCH], position
+        if position >= len(header):
+            continue
+        child = node.get(header[position])
+        if child is not None:
+            stack.append((child, position + 1))
+        child = node.get(ANY)
+        if child is not None:
+            stack.append((child, position + 1))
+    return best
+
+# True if a file of this type is expected to have this extension
+def matches_extension(file_type, extension):
+    return extension in SIGNATURES[file_type][1]
+
+# Bounded least recently used cache of detected types, safe to share
+# between threads. Keys are the file identity, so a file that changes gets
+# a new key and its old entry is eventually evicted
+class SniffCache:
+    def __init__(self, capacity=1000000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(st):
+        return f"{st.st_dev}:{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    # Entries are saved from least to most recently used, so loading them
+    # in order restores the LRU order too
+    def load(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as f:
+            data = json.load(f)
+        for key, value in data["entries"]:
+            self.put(key, value)
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with self.lock:
+            entries = list(self.entries.items())
+        with open(tmp, "w") as f:
+            json.dump({"version": 1, "entries": entries}, f)
+        os.replace(tmp, path)
+
+# Detect the type of a file, reading only its first HEADER_SIZE bytes and
+# only on a cache miss. st is the os.stat() result if already known
+def sniff(path, cache=None, st=None):
+    if cache is not None:
+        if st is None:
+            st = os.stat(path)
+        key = SniffCache.key(st)
+        found, file_type = cache.get(key)
+        if found:
+            return file_type
+    with open(path, "rb") as f:
+        file_type = detect_type(f.read(HEADER_SIZE))
+    if cache is not None:
+        cache.put(key, file_type)
+    return file_type
@@ -0,0 +1,219 @@
+# Columnar on-disk cache of parsed access logs used by 3_LogAnalisis.py
+# --build-index / --index. Repeat queries read fixed-width column files
+# instead of parsing the raw text again
+#
+# Layout of an index directory:
+#   meta.json          row/line counts, blocks with their min/max timestamp,
+#                      dictionaries (first-seen order) of the text columns
+#   ts.col             int64 epoch seconds (-1 = unknown)
+#   status.col         uint16 status code (0 = unknown)
+#   bytes.col          int64 bytes sent (-1 = unknown)
+#   hour.col           uint8 hour of day as written in the log (255 = unknown)
+#   ua/ip/method/path.col  uint32 codes into the dictionaries (0 = unknown)
+# All columns are little endian and written in blocks of BLOCK_ROWS rows
+
+import os
+import sys
+import json
+import array
+import calendar
+from collections import Counter
+from itertools import compress
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BLOCK_ROWS = 65536
+
+# Column name -> array typecode / numpy dtype
+COLUMNS = {
+    "ts": ("q", "<i8"),
+    "status": ("H", "<u2"),
+    "bytes": ("q", "<i8"),
+    "hour": ("B", "u1"),
+    "ua": ("I", "<u4"),
+    "ip": ("I", "<u4"),
+    "method": ("I", "<u4"),
+    "path": ("I", "<u4"),
+}
+
+# Dictionary encoded columns and their index in a parsed record
+TEXT_COLUMNS = {"ip": 0, "method": 2, "path": 3, "ua": 7}
+
+MONTHS = {m: i for i, m in enumerate(("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+                                      "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), 1)}
+
+# "24/Jul/2019:06:51:05 +0000" -> epoch seconds, or -1
+def parse_timestamp(stamp):
+    try:
+        seconds = calendar.timegm((int(stamp[7:11]), MONTHS[stamp[3:6]], int(stamp[0:2]),
+                                   int(stamp[12:14]), int(stamp[15:17]), int(stamp[18:20])))
+        offset = (int(stamp[22:24]) * 60 + int(stamp[24:26])) * 60 if len(stamp) >= 26 else 0
+        return seconds - offset if stamp[21:22] == "+" else seconds + offset
+    except (KeyError, ValueError):
+        return -1
+
+def to_int(value, missing):
+    return int(value) if value and value.isascii() and value.isdigit() else missing
+
+# Write the rows of parsed records (tuples ordered like FIELDS in
+# 3_LogAnalisis.py, None for unparsable lines) into out_dir
+def build_index(records, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    dictionaries = {name: {None: 0} for name in TEXT_COLUMNS}
+    first_seen = {"status": {}, "hour": {}}
+    files = {name: open(os.path.join(out_dir, f"{name}.col"), "wb") for name in COLUMNS}
+    block = {name: array.array(typecode) for name, (typecode, _) in COLUMNS.items()}
+    meta = {"version": 1, "block_rows": BLOCK_ROWS, "rows": 0, "lines": 0, "blocks": []}
+    last_stamp, last_ts = None, -1
+    try:
+        for record in records:
+            meta["lines"] += 1
+            if record is None:
+                continue
+            stamp = record[1]
+            if stamp != last_stamp:
+                last_stamp, last_ts = stamp, parse_timestamp(stamp) if stamp else -1
+            block["ts"].append(last_ts)
+            status = to_int(record[4], 0)
+            hour = to_int(stamp[12:14], 255) if stamp else 255
+            block["status"].append(status if status < 65536 else 0)
+            block["bytes"].append(to_int(record[5], -1))
+            block["hour"].append(hour if hour < 24 else 255)
+            first_seen["status"].setdefault(status, None)
+            first_seen["hour"].setdefault(hour, None)
+            for name, index in TEXT_COLUMNS.items():
+                codes = dictionaries[name]
+                value = record[index]
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(codes)
+                block[name].append(code)
+            if len(block["ts"]) == BLOCK_ROWS:
+                flush_block(block, files, meta)
+        flush_block(block, files, meta)
+    finally:
+        for f in files.values():
+            f.close()
+    meta["dictionaries"] = {name: list(codes)[1:] for name, codes in dictionaries.items()}
+    meta["first_seen"] = {"status": [key for key in first_seen["status"] if key != 0],
+                          "hour": [key for key in first_seen["hour"] if key != 255]}
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+def flush_block(block, files, meta):
+    rows = len(block["ts"])
+    if not rows:
+        return
+    known = [ts for ts in block["ts"] if ts >= 0]
+    meta["blocks"].append({"rows": rows,
+                           "min_ts": min(known) if known else None,
+                           "max_ts": max(known) if known else None})
+    meta["rows"] += rows
+    for name, column in block.items():
+        if sys.byteorder == "big":
+            column.byteswap()
+        column.tofile(files[name])
+        del column[:]
+
+def load_meta(index_dir):
+    with open(os.path.join(index_dir, "meta.json"), "r") as f:
+        return json.load(f)
+
+# Read rows [start, start + rows) of a column
+def read_column(index_dir, name, start, rows):
+    typecode, dtype = COLUMNS[name]
+    path = os.path.join(index_dir, f"{name}.col")
+    if np is not None:
+        return np.fromfile(path, dtype=dtype, count=rows, offset=start * np.dtype(dtype).itemsize)
+    column = array.array(typecode)
+    with open(path, "rb") as f:
+        f.seek(start * column.itemsize)
+        column.fromfile(f, rows)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+# Rows of one block that pass the filters: None (all of them), a numpy
+# boolean mask or a list of booleans
+def block_mask(index_dir, start, rows, status_range, since, until):
+    mask = None
+    if since is not None or until is not None:
+        ts = read_column(index_dir, "ts", start, rows)
+        lo = 0 if since is None else since
+        hi = (1 << 62) if until is None else until
+        mask = (ts >= lo) & (ts < hi) if np is not None else [lo <= t < hi for t in ts]
+    if status_range is not None:
+        lo, hi = status_range
+        status = read_column(index_dir, "status", start, rows)
+        if np is not None:
+            status_mask = (status >= lo) & (status < hi)
+            mask = status_mask if mask is None else mask & status_mask
+        else:
+            status_mask = [lo <= s < hi for s in status]
+            mask = status_mask if mask is None else [a and b for a, b in zip(mask, status_mask)]
+    return mask
+
+# Count a column of one block (optionally masked) into counts
+def count_column(column, mask, counts, size):
+    if np is not None:
+        values = column if mask is None else column[mask]
+        counts += np.bincount(values, minlength=size)[:size]
+    else:
+        counts.update(column if mask is None else compress(column, mask))
+
+# Aggregate the dims over the rows matching the filters. Blocks whose
+# timestamps are all outside [since, until) are skipped without reading
+# them. Returns Counters keyed like a raw scan, the lines and rows matched
+def query_index(index_dir, dims, status_range=None, since=None, until=None):
+    meta = load_meta(index_dir)
+    sizes = {name: len(meta["dictionaries"][name]) + 1 for name in TEXT_COLUMNS}
+    sizes.update(status=65536, hour=256)
+    totals = {dim: (np.zeros(sizes[dim], dtype=np.int64) if np is not None else Counter())
+              for dim in dims if dim != "bytes"}
+    total_bytes = 0
+    matched = 0
+    start = 0
+    for block in meta["blocks"]:
+        rows = block["rows"]
+        block_start, start = start, start + rows
+        if since is not None or until is not None:
+            if block["min_ts"] is None:
+                continue
+            if since is not None and block["max_ts"] < since:
+                continue
+            if until is not None and block["min_ts"] >= until:
+                continue
+        mask = block_mask(index_dir, block_start, rows, status_range, since, until)
+        if mask is None:
+            matched += rows
+        else:
+            matched += int(np.count_nonzero(mask)) if np is not None else sum(mask)
+        for dim, counts in totals.items():
+            count_column(read_column(index_dir, dim, block_start, rows), mask, counts, sizes[dim])
+        if "bytes" in dims:
+            sent = read_column(index_dir, "bytes", block_start, rows)
+            if np is not None:
+                sent = sent if mask is None else sent[mask]
+                total_bytes += int(sent[sent >= 0].sum())
+            else:
+                total_bytes += sum(b for b in (sent if mask is None else compress(sent, mask)) if b >= 0)
+
+    # Codes -> keys, in the order the keys were first seen while ingesting
+    counters = {}
+    for dim in dims:
+        if dim == "bytes":
+            counters[dim] = Counter(total=total_bytes)
+            continue
+        counts = totals[dim]
+        if dim in TEXT_COLUMNS:
+            keys = enumerate(meta["dictionaries"][dim], 1)
+        elif dim == "hour":
+            keys = ((hour, f"{hour:02d}") for hour in meta["first_seen"]["hour"])
+        else:
+            keys = ((status, str(status)) for status in meta["first_seen"]["status"])
+        counters[dim] = Counter({key: int(counts[code]) for code, key in keys if counts[code]})
+    return counters, meta["lines"], matched
@@ -0,0 +1,121 @@
+# Mergeable sketches used by 3_LogAnalisis.py --sketch to count high
+# cardinality dimensions (user agents, client IPs, paths) in bounded memory
+
+import math
+import heapq
+import hashlib
+
+# Space-Saving summary of the heaviest keys. At most `capacity` keys are
+# kept; the estimated count of a key is never below its true count and
+# overestimates it by at most total / capacity
+class SpaceSaving:
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+
+    # Count a batch of exact counts ({key: count}, e.g. a Counter)
+    def update(self, counts):
+        other = SpaceSaving(len(counts) + 1)
+        other.counts = dict(counts)
+        other.total = sum(other.counts.values())
+        self.merge(other)
+
+    # Merge another summary (parallel Space-Saving). A key missing from a
+    # full summary may have been evicted from it, so it gets that summary's
+    # smallest count as both count and error
+    def merge(self, other):
+        floor = self.floor()
+        other_floor = other.floor()
+        counts = {}
+        errors = {}
+        for key in self.counts.keys() | other.counts.keys():
+            counts[key] = self.counts.get(key, floor) + other.counts.get(key, other_floor)
+            errors[key] = self.errors.get(key, floor) + other.errors.get(key, other_floor)
+        if len(counts) > self.capacity:
+            keep = heapq.nlargest(self.capacity, counts, key=counts.get)
+            counts = {key: counts[key] for key in keep}
+            errors = {key: errors[key] for key in keep}
+        self.counts = counts
+        self.errors = errors
+        self.total += other.total
+
+    # Smallest count of a full summary, 0 while keys are still exact
+    def floor(self):
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    # Worst case overestimation of any count
+    def error_bound(self):
+        return self.total // self.capacity
+
+    # [(key, estimated count, max error)] sorted by estimated count
+    def most_common(self, n=None):
+        keys = sorted(self.counts, key=lambda key: (-self.counts[key], str(key)))
+        return [(key, self.counts[key], self.errors[key]) for key in keys[:n]]
+
+# HyperLogLog estimate of the number of distinct keys with 2 ** precision
+# one-byte registers. The standard error is 1.04 / sqrt(2 ** precision)
+class HyperLogLog:
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, key):
+        if isinstance(key, str):
+            key = key.encode("utf-8", errors="surrogateescape")
+        value = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    # Registers are maxima, so two sketches merge register by register
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("can't merge HyperLogLogs with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Small range correction (linear counting)
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+# Both sketches for one dimension: heavy hitters and distinct keys
+class DimensionSketch:
+    def __init__(self, capacity=1024, precision=14):
+        self.heavy = SpaceSaving(capacity)
+        self.distinct = HyperLogLog(precision)
+
+    # Fold a batch of exact counts into the sketches
+    def update(self, counts):
+        self.heavy.update(counts)
+        self.distinct.update(counts)
+
+    def merge(self, other):
+        self.heavy.merge(other.heavy)
+        self.distinct.merge(other.distinct)
+
+    # Plain-text summary of the error bounds
+    def describe(self):
+        return (f"~{self.distinct.estimate()} distinct key(s) (HyperLogLog, "
+                f"{len(self.distinct.registers)} registers, ±{self.distinct.relative_error():.2%} std. error); "
+                f"counts over {self.heavy.total} request(s) are overestimated by at most "
+                f"{self.heavy.error_bound()} (Space-Saving, {self.heavy.capacity} counters)")
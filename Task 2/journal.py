@@ -0,0 +1,129 @@
+# Campaign journal for sendsurvey.py: a SQLite file recording, for every
+# survey definition, the survey, collector and message already created and
+# the recipients the API already accepted. A run that is interrupted can be
+# rerun without creating a second survey or adding anyone twice
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Most values bound in one SQLite statement (the limit is 32766 since 3.32)
+MAX_PARAMETERS = 10000
+
+# Campaigns are keyed by the SHA-256 of the questions file. Recipients are
+# kept as a 64 bit hash of the lowercase address, not the address itself,
+# next to the integer id of their campaign
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    questions TEXT NOT NULL,
+    survey_id TEXT,
+    preview_url TEXT,
+    collector_id TEXT,
+    message_id TEXT,
+    created REAL NOT NULL,
+    sent REAL
+);
+CREATE TABLE IF NOT EXISTS recipients (
+    campaign INTEGER NOT NULL,
+    digest INTEGER NOT NULL,
+    PRIMARY KEY (campaign, digest)
+) WITHOUT ROWID;
+"""
+
+# Values of a campaign set as the run goes
+STEPS = ("survey_id", "preview_url", "collector_id", "message_id", "sent")
+
+# $XDG_STATE_HOME/sendsurvey/journal.db, ~/.local/state by default
+def default_path():
+    state = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(state, "sendsurvey", "journal.db")
+
+def campaign_key(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+# Stable across runs, unlike hash()
+def digest(address):
+    return int.from_bytes(hashlib.blake2b(address.lower().encode(), digest_size=8).digest(), "big", signed=True)
+
+# Journal of one campaign. The connection is shared by the sender threads,
+# so every statement runs under a lock; each batch of recipients is one
+# transaction. In WAL mode with synchronous=NORMAL a commit survives a crash
+# of the script (not always a power cut, but the API reports re-added
+# recipients as "existing", so replaying a batch is harmless)
+class Journal:
+    def __init__(self, path, key, questions_file):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.key = key
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.execute("INSERT OR IGNORE INTO campaigns (key, questions, created) VALUES (?, ?, ?)",
+                                (key, os.path.abspath(questions_file), time.time()))
+        self.id = self.connection.execute("SELECT id FROM campaigns WHERE key = ?", (key,)).fetchone()[0]
+
+    # The campaign as a dict of STEPS (None for the ones not done yet)
+    def campaign(self):
+        with self.lock:
+            row = self.connection.execute(f"SELECT {', '.join(STEPS)} FROM campaigns WHERE id = ?",
+                                          (self.id,)).fetchone()
+        return dict(zip(STEPS, row))
+
+    def record(self, **values):
+        assignments = ", ".join(f"{step} = ?" for step in values)
+        with self.lock:
+            self.connection.execute(f"UPDATE campaigns SET {assignments} WHERE id = ?",
+                                    (*values.values(), self.id))
+
+    # Forget the campaign, so the next steps start a new one
+    def reset(self):
+        with self.lock, self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute("DELETE FROM recipients WHERE campaign = ?", (self.id,))
+            self.connection.execute(f"UPDATE campaigns SET {', '.join(f'{step} = NULL' for step in STEPS)}, "
+                                    "created = ? WHERE id = ?", (time.time(), self.id))
+
+    # Number of recipients already added
+    def added(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM recipients WHERE campaign = ?",
+                                           (self.id,)).fetchone()[0]
+
+    # List of booleans: True for the addresses already added
+    def done(self, addresses):
+        digests = [digest(address) for address in addresses]
+        found = set()
+        with self.lock:
+            for start in range(0, len(digests), MAX_PARAMETERS):
+                part = digests[start:start + MAX_PARAMETERS]
+                rows = self.connection.execute(
+                    f"SELECT digest FROM recipients WHERE campaign = ? AND digest IN ({','.join(['?'] * len(part))})",
+                    (self.id, *part))
+                found.update(value for value, in rows)
+        return [value in found for value in digests]
+
+    def mark_added(self, addresses):
+        rows = [(self.id, digest(address)) for address in addresses]
+        with self.lock, self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.executemany("INSERT OR IGNORE INTO recipients VALUES (?, ?)", rows)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,141 @@
+# Recipient list handling for sendsurvey.py. Addresses are read lazily,
+# normalised, validated and deduplicated, and handed out in batches the
+# size of one bulk API request, so lists of any length run in bounded memory
+
+import os
+import re
+import sqlite3
+import tempfile
+from itertools import islice
+
+# Most recipients accepted by one bulk request
+BULK_LIMIT = 1000
+
+# Bound parameters of one SQLite statement (the limit is 32766 since 3.32)
+MAX_PARAMETERS = 10000
+
+# RFC 5321 limits
+MAX_LENGTH = 254
+MAX_LOCAL_LENGTH = 64
+
+# Dot-atom local part (quoted local parts aren't accepted by the API anyway)
+# and a domain of at least two labels, the last one not numeric
+ADDRESS_PATTERN = re.compile(
+    r"([A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*)"
+    r"@((?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?)$")
+
+# Drop what commonly surrounds an address in a list: angle brackets,
+# "mailto:" and a trailing dot in the domain. Non-ASCII domains are IDNA
+# encoded. None if the domain can't be encoded
+def clean(address):
+    if address.startswith("<") and address.endswith(">"):
+        address = address[1:-1].strip()
+    if address[:7].lower() == "mailto:":
+        address = address[7:]
+    local, at, domain = address.rpartition("@")
+    domain = domain.rstrip(".")
+    if not domain.isascii():
+        try:
+            domain = domain.lower().encode("idna").decode("ascii")
+        except UnicodeError:
+            return None
+    return f"{local}{at}{domain}"
+
+# Normalised form of an address, or None if it isn't valid. The domain is
+# lowercased; the local part keeps its case, as the RFC says it's case
+# sensitive. Plain addresses take a single regex match
+def normalize(address):
+    address = address.strip()
+    match = ADDRESS_PATTERN.match(address)
+    if match is None:
+        address = clean(address)
+        match = address and ADDRESS_PATTERN.match(address)
+        if not match:
+            return None
+    local, domain = match.groups()
+    if len(local) > MAX_LOCAL_LENGTH or len(address) > MAX_LENGTH:
+        return None
+    return f"{local}@{domain.lower()}"
+
+# Set of the addresses already seen, kept on disk in SQLite as 64 bit
+# hashes so memory doesn't grow with the list. Addresses are compared
+# case-insensitively. With 10^8 addresses the chance of any two hashes
+# colliding (and a recipient being skipped) is below 1 in 3000. The hash
+# is Python's own, which is salted per process: the set lives for one run
+class SeenSet:
+    def __init__(self, directory=None, cache_mb=64):
+        fd, self.path = tempfile.mkstemp(prefix="seen-", suffix=".db", dir=directory)
+        os.close(fd)
+        self.connection = sqlite3.connect(self.path, isolation_level=None)
+        # Scratch data: no journal and no fsync
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute(f"PRAGMA cache_size = {-cache_mb * 1024}")
+        self.connection.execute("CREATE TABLE seen (digest INTEGER PRIMARY KEY)")
+
+    # Add addresses to the set with a single statement. Returns a list of
+    # booleans: True for the addresses that weren't in it yet
+    def add(self, addresses):
+        digests = [hash(address.lower()) for address in addresses]
+        new = set()
+        # Stay under SQLite's limit of bound parameters per statement
+        for start in range(0, len(digests), MAX_PARAMETERS):
+            part = digests[start:start + MAX_PARAMETERS]
+            rows = self.connection.execute(
+                f"INSERT OR IGNORE INTO seen VALUES {','.join(['(?)'] * len(part))} RETURNING digest", part)
+            new.update(digest for digest, in rows)
+        # A repeated address in the same call is only new the first time
+        result = []
+        for digest in digests:
+            result.append(digest in new)
+            new.discard(digest)
+        return result
+
+    def close(self):
+        self.connection.close()
+        os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Batches of at most `size` valid, unique addresses from a stream of lines
+# (blank lines are ignored). The skipped lines are counted in `skipped`
+# ("invalid" and "duplicate") and passed to `on_invalid` if given. `done`
+# can tell which addresses were already handled (a list of booleans for a
+# list of addresses); those are skipped and counted as "done"
+def iter_batches(lines, seen, skipped, size=BULK_LIMIT, on_invalid=None, done=None):
+    lines = iter(lines)
+    batch = []
+    for chunk in iter(lambda: list(islice(lines, size)), []):
+        valid = []
+        for line in chunk:
+            line = line.strip()
+            if not line:
+                continue
+            address = normalize(line)
+            if address is None:
+                skipped["invalid"] += 1
+                if on_invalid is not None:
+                    on_invalid(line)
+                continue
+            valid.append(address)
+        unique = []
+        for address, new in zip(valid, seen.add(valid)):
+            if new:
+                unique.append(address)
+            else:
+                skipped["duplicate"] += 1
+        if done is not None and unique:
+            flags = done(unique)
+            skipped["done"] += sum(flags)
+            unique = [address for address, flag in zip(unique, flags) if not flag]
+        for address in unique:
+            batch.append(address)
+            if len(batch) == size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
@@ -3,27 +3,119 @@
 
 import os
 import sys
+import time
+import json
+import random
+import sqlite3
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import recipients
+import journal
 
-load_dotenv()
-access_token = os.getenv("TOKEN")
-if access_token is None:
-    print("Error: TOKEN environment variable not set.")
-    sys.exit(1)
+DEFAULT_API_BASE = "https://api.surveymonkey.com/v3"
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RETRIES = 5
 
-# Function to create the survey
-def create_survey(token,questions):
-    url = "https://api.surveymonkey.com/v3/surveys"
+# Seconds before a request is abandoned (connect, read)
+TIMEOUT = (5, 30)
+
+# Backoff after a failed attempt: random in [0, BACKOFF_BASE * 2 ** attempt],
+# at most BACKOFF_CAP seconds
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+
+# Statuses worth retrying: rate limited or the API is temporarily down
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Lists of addresses a bulk recipients request turns down. Addresses that
+# already are recipients of the message come back in "existing"
+REJECTED = ("invalids", "bounced", "opted_out")
 
-    headers = {
+# Thread-safe counters shared by the sender threads
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def add(self, key, amount=1):
+        with self.lock:
+            self.counts[key] += amount
+
+# One HTTP session for the whole run: connections are kept alive and reused
+# by every request instead of a new TCP/TLS handshake per call
+def create_session(token, pool_size=DEFAULT_CONCURRENCY):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
         "Content-Type": "application/json",
         "Accept": "application/json",
-        "Authorization": f"Bearer {token}" 
-    }
+        "Authorization": f"Bearer {token}"
+    })
+    return session
+
+# Seconds asked for by a Retry-After header (delay or HTTP date), or None
+def retry_after(response):
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff(attempt):
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
 
-    response = requests.post(url, json=questions, headers=headers)
+# POST with retries on 429/5xx and connection errors. A Retry-After header
+# is honoured, plus some jitter so throttled threads don't all come back at
+# the same instant. Returns the last response.
+# A request that isn't `idempotent` (it creates something) may have been
+# carried out despite a 5xx or a lost response, so it is only retried when
+# it surely wasn't: throttled (429) or the connection never made
+def post(session, url, payload, retries=DEFAULT_RETRIES, stats=None, idempotent=True):
+    retry_errors = (requests.ConnectionError, requests.Timeout) if idempotent else requests.ConnectTimeout
+    retry_statuses = RETRY_STATUSES if idempotent else (429,)
+    for attempt in range(retries + 1):
+        try:
+            response = session.post(url, json=payload, timeout=TIMEOUT)
+        except retry_errors:
+            if attempt == retries:
+                raise
+            delay = backoff(attempt)
+        else:
+            if response.status_code not in retry_statuses or attempt == retries:
+                return response
+            delay = retry_after(response)
+            delay = backoff(attempt) if delay is None else delay + random.uniform(0, BACKOFF_BASE)
+        if stats is not None:
+            stats.add("retries")
+        time.sleep(delay)
+
+def error_message(response):
+    try:
+        return response.json()["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        return response.text
+
+# Function to create the survey
+def create_survey(session, api_base, questions):
+    url = f"{api_base}/surveys"
+
+    response = post(session, url, questions, idempotent=False)
 
     print(response.status_code, end=" --> ")
     if response.status_code ==201:
@@ -38,12 +130,12 @@ def create_survey(token,questions):
     return survey_id, preview_url
 
 # Function to create the collector
-def create_collector(token,survey_id):
-    url = f"https://api.surveymonkey.com/v3/surveys/{survey_id}/collectors"
+def create_collector(session, api_base, survey_id):
+    url = f"{api_base}/surveys/{survey_id}/collectors"
 
     collector_config = {
-        "type": "weblink",       
-        "name": "My survey link",  
+        "type": "email",
+        "name": "My survey emails",
         "thank_you_page": {
             "is_enabled": True,
             "message": "Thank you for your answer"
@@ -54,72 +146,257 @@ def create_collector(token,survey_id):
         "redirect_url": "https://exampleredirect.com/thankyou"
     }
 
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
+    response = post(session, url, collector_config, idempotent=False)
 
-    response = requests.post(url, json=collector_config, headers=headers)
-    
     if response.status_code not in [200, 201, 204]:
-        print("Error", response.status_code, "creating collector -->", response.json()["error"]["message"])
+        print("Error", response.status_code, "creating collector -->", error_message(response))
         return False
-    
+
     print("Collector succesfully created")
     collector_id = response.json()["id"]
     return collector_id
 
+# Function to create the invitation message the recipients are added to
+def create_message(session, api_base, collector_id):
+    url = f"{api_base}/collectors/{collector_id}/messages"
+
+    response = post(session, url, {"type": "invite"}, idempotent=False)
+
+    if response.status_code not in [200, 201]:
+        print("Error", response.status_code, "creating message -->", error_message(response))
+        return None
+    return response.json()["id"]
+
+# Add a batch of recipients to the message with one bulk request. Returns
+# the addresses added and the ones that already were recipients, or None if
+# the whole batch failed. Addresses the API turns down (invalid, bounced,
+# opted out...) are reported and counted
+def add_recipients(session, api_base, collector_id, message_id, emails, retries=DEFAULT_RETRIES, stats=None):
+    url = f"{api_base}/collectors/{collector_id}/messages/{message_id}/recipients/bulk"
+    try:
+        response = post(session, url, {"contacts": [{"email": email} for email in emails]}, retries, stats)
+    except requests.RequestException as e:
+        print(f"Error sending survey to {len(emails)} recipient(s): {e}")
+        return None
+    if response.status_code not in [200, 201]:
+        print(f"Error {response.status_code} sending survey to {len(emails)} recipient(s) --> {error_message(response)}")
+        return None
+    result = response.json()
+    for reason in REJECTED:
+        for contact in result.get(reason, []):
+            print(f"Survey not sent to {contact.get('email', contact)}: {reason.replace('_', ' ')}")
+            if stats is not None:
+                stats.add("rejected")
+    added = [contact["email"] for contact in result.get("succeeded", [])]
+    existing = [contact["email"] for contact in result.get("existing", [])]
+    if stats is not None:
+        stats.add("existing", len(existing))
+    return added, existing
+
+# Function to send the message to all its recipients
+def send_message(session, api_base, collector_id, message_id):
+    url = f"{api_base}/collectors/{collector_id}/messages/{message_id}/send"
+
+    response = post(session, url, {}, idempotent=False)
+
+    if response.status_code not in [200, 201, 202]:
+        print("Error", response.status_code, "sending message -->", error_message(response))
+        return False
+    return True
+
+# Add every batch of recipients with at most `concurrency` requests in
+# flight. The batches are consumed lazily, so only a window of them is
+# queued at a time. Accepted batches are recorded in the journal if given.
+# On Ctrl-C the queued batches are dropped and the ones in flight finish,
+# so the journal is left consistent. Returns the Stats of the run
+def dispatch(session, api_base, collector_id, message_id, batches, concurrency=DEFAULT_CONCURRENCY,
+             retries=DEFAULT_RETRIES, verbose=False, journal=None):
+    stats = Stats()
+    window = threading.BoundedSemaphore(concurrency * 2)
+
+    def send(batch):
+        try:
+            result = add_recipients(session, api_base, collector_id, message_id, batch, retries, stats)
+            if result is None:
+                stats.add("failed", len(batch))
+                return
+            added, existing = result
+            if journal is not None:
+                journal.mark_added(added + existing)
+            stats.add("sent", len(added))
+            if verbose:
+                for email in added:
+                    print(f"Survey sent to {email}")
+        except Exception as e:
+            # Nothing reads the futures: a batch that raised would otherwise
+            # vanish from the counts, and the survey could go out without it
+            print(f"Error sending survey to {len(batch)} recipient(s): {e!r}")
+            stats.add("failed", len(batch))
+        finally:
+            window.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for batch in batches:
+                window.acquire()
+                executor.submit(send, batch)
+        except KeyboardInterrupt:
+            executor.shutdown(cancel_futures=True)
+            raise
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(prog="sendsurvey.py",
+                                     description="Create a SurveyMonkey survey and send it to a list of emails.")
+    parser.add_argument('questions', help='JSON file with the survey definition')
+    parser.add_argument('emails', help='File with one email per line')
+    parser.add_argument('--api-base', default=os.getenv("SURVEYMONKEY_API_BASE", DEFAULT_API_BASE),
+                        help=f'API base URL, e.g. a local stub server (default: $SURVEYMONKEY_API_BASE or {DEFAULT_API_BASE})')
+    parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_CONCURRENCY, help=f'Requests in flight at once (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help=f'Retries of a throttled or failed request (default: {DEFAULT_RETRIES})')
+    parser.add_argument('-b', '--batch-size', type=int, default=recipients.BULK_LIMIT,
+                        help=f'Recipients added per bulk request (default and maximum: {recipients.BULK_LIMIT})')
+    parser.add_argument('--journal', metavar='FILE', default=journal.default_path(),
+                        help='SQLite journal of the campaigns, used to resume an interrupted run (default: %(default)s)')
+    parser.add_argument('--no-journal', action='store_true', help="Don't record or resume the campaign")
+    parser.add_argument('--new', action='store_true', help='Start a new campaign even if these questions were already sent')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print every recipient and skipped line')
+    args = parser.parse_args()
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if not 1 <= args.batch_size <= recipients.BULK_LIMIT:
+        parser.error(f"--batch-size must be between 1 and {recipients.BULK_LIMIT}")
+
+    load_dotenv()
+    access_token = os.getenv("TOKEN")
+    if access_token is None:
+        print("Error: TOKEN environment variable not set.")
+        sys.exit(1)
+
+    questions_file = args.questions
+    emails_file = args.emails
+    api_base = args.api_base.rstrip("/")
+
+    # Check if questions file exists has JSON format and can be read
+    try:
+        with open(questions_file, 'r') as f:
+            questions = json.load(f)
+    except FileNotFoundError:
+        print(f"File {questions_file} not found.")
+        sys.exit(1)
+    except json.JSONDecodeError:
+        print(f"Error decoding JSON from file {questions_file}.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error reading file {questions_file}: {e}")
+        sys.exit(1)
+    # Check if questions file is empty
+    if not questions:
+        print(f"File {questions_file} is empty.")
+        sys.exit(1)
+
+    # Check if emails file exists and can be read. The file is streamed:
+    # addresses are normalised, validated and deduplicated as they are sent
+    try:
+        emails = open(emails_file, 'r', encoding='utf-8', errors='replace')
+    except FileNotFoundError:
+        print(f"File {emails_file} not found.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error reading file {emails_file}: {e}")
+        sys.exit(1)
+
+    def skip_invalid(line):
+        if args.verbose:
+            print(f"Skipping invalid address: {line}")
+
+    # Campaign journal, keyed by the content of the questions file
+    campaign_journal = None
+    campaign = dict.fromkeys(journal.STEPS)
+    if not args.no_journal:
+        try:
+            campaign_journal = journal.Journal(args.journal, journal.campaign_key(questions_file), questions_file)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error opening journal {args.journal}: {e}")
+            sys.exit(1)
+        if args.new:
+            campaign_journal.reset()
+        campaign = campaign_journal.campaign()
+        if campaign["sent"]:
+            print(f"Survey {campaign['preview_url']} was already sent. Use --new to send it again.")
+            sys.exit(0)
+
+    skipped = Counter()
+    with emails, recipients.SeenSet() as seen, (campaign_journal or nullcontext()):
+        done = campaign_journal.done if campaign_journal else None
+        already_added = campaign_journal.added() if campaign_journal else 0
+        batches = recipients.iter_batches(emails, seen, skipped, args.batch_size, skip_invalid, done)
+        # Check if emails file has any valid address not added yet
+        first = next(batches, None)
+        if first is None and not already_added:
+            print(f"File {emails_file} has no valid email address.")
+            sys.exit(1)
+        batches = chain([first], batches) if first is not None else iter(())
+
+        def record(**values):
+            campaign.update(values)
+            if campaign_journal:
+                campaign_journal.record(**values)
+
+        session = create_session(access_token, args.concurrency)
+        try:
+            # Create Survey, unless an earlier run already did
+            if campaign["survey_id"]:
+                print(f"Resuming survey {campaign['survey_id']}: {already_added} recipient(s) already added.")
+            else:
+                survey_id, survey_url = create_survey(session, api_base, questions)
+                if not survey_id:
+                    sys.exit(1)
+                record(survey_id=survey_id, preview_url=survey_url)
+
+            # Create collector and message to send the survey to the list of emails
+            if not campaign["collector_id"]:
+                collector_id = create_collector(session, api_base, campaign["survey_id"])
+                if not collector_id:
+                    print("Collector couldn't be created with free account.")
+                    sys.exit(1)
+                record(collector_id=collector_id)
+            if not campaign["message_id"]:
+                message_id = create_message(session, api_base, campaign["collector_id"])
+                if not message_id:
+                    sys.exit(1)
+                record(message_id=message_id)
+
+            started = time.perf_counter()
+            stats = dispatch(session, api_base, campaign["collector_id"], campaign["message_id"], batches,
+                             args.concurrency, args.retries, args.verbose, campaign_journal)
+            elapsed = time.perf_counter() - started
+            # A failed batch would be left out of the message: with a journal
+            # leave it unsent, so a rerun can add the missing recipients first
+            if stats.counts["failed"] and campaign_journal:
+                print("Message not sent: some recipients couldn't be added. Rerun to retry them.")
+            elif (stats.counts["sent"] or stats.counts["existing"] or already_added) and \
+                    send_message(session, api_base, campaign["collector_id"], campaign["message_id"]):
+                record(sent=time.time())
+                print(f"Survey {campaign['preview_url']} sent.")
+        except requests.RequestException as e:
+            print(f"Error connecting to {api_base}: {e}")
+            sys.exit(1)
+        except KeyboardInterrupt:
+            print("Interrupted." + (" Rerun to resume the campaign." if campaign_journal else ""))
+            sys.exit(130)
+        finally:
+            session.close()
+
+    rate = stats.counts["sent"] / elapsed if elapsed else 0
+    print(f"{stats.counts['sent']} recipient(s) added, {stats.counts['failed']} failed, "
+          f"{stats.counts['retries']} retried request(s) in {elapsed:.2f}s ({rate:.1f} sends/sec)")
+    print(f"Skipped {skipped['duplicate']} duplicate and {skipped['invalid']} invalid address(es), "
+          f"{skipped['done']} added by an earlier run; "
+          f"{stats.counts['rejected']} rejected by the API, {stats.counts['existing']} already recipients")
+    if stats.counts["failed"]:
+        sys.exit(1)
 
-# Check number of arguments
-if len(sys.argv) != 3:
-    print("Usage: ./sendsurvey.py <questions.json> <emails.txt>")
-    sys.exit(1)
-
-questions_file = sys.argv[1]
-emails_file = sys.argv[2]
-
-# Check if questions file exists has JSON format and can be read
-try:
-    with open(questions_file, 'r') as f:
-        questions = json.load(f)
-except FileNotFoundError:
-    print(f"File {questions_file} not found.")
-    sys.exit(1)
-except json.JSONDecodeError:
-    print(f"Error decoding JSON from file {questions_file}.")
-    sys.exit(1)
-except Exception as e:
-    print(f"Error reading file {questions_file}: {e}")
-    sys.exit(1)
-# Check if questions file is empty
-if not questions:
-    print(f"File {questions_file} is empty.")
-    sys.exit(1)
-
-# Check if emails file exists and can be read
-try:
-    with open(emails_file, 'r') as f:
-        #emails = f.readlines()
-        emails = [email.strip() for email in f]
-except FileNotFoundError:
-    print(f"File {emails_file} not found.")
-    sys.exit(1)
-except Exception as e:
-    print(f"Error reading file {emails_file}: {e}")
-    sys.exit(1)
-# Check if emails file is empty
-if not emails:
-    print(f"File {emails_file} is empty.")
-    sys.exit(1)
-
-
-# Create Survey
-survey_id, survey_url = create_survey(token=access_token, questions=questions)
-
-# Create collector to share the survey with the list of emails
-collector_id = create_collector(token=access_token, survey_id=survey_id)
-if not collector_id: print("Collector couldn't be created with free account.")
-
-for email in emails:
-    print(f'"Sending" survey to {email} as {survey_url}')
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Local stand-in for the parts of the SurveyMonkey API used by
+# sendsurvey.py, to try it (and measure it) without a real account:
+#   ./stub_server.py --port 8080 --rate-limit 50
+#   TOKEN=x ./sendsurvey.py --api-base http://127.0.0.1:8080/v3 questions.json emails.txt
+
+import re
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ids = itertools.count(1)
+lock = threading.Lock()
+stats = Counter()
+# Message id -> addresses (lowercase) already added to it
+recipients = {}
+
+# Most contacts accepted by one bulk request
+BULK_LIMIT = 1000
+
+# (method, path pattern) -> handler name
+ROUTES = [
+    ("POST", re.compile(r"^/v3/surveys$"), "create_survey"),
+    ("POST", re.compile(r"^/v3/surveys/(?P<survey>[^/]+)/collectors$"), "create_collector"),
+    ("POST", re.compile(r"^/v3/collectors/(?P<collector>[^/]+)/messages$"), "create_message"),
+    ("POST", re.compile(r"^/v3/collectors/(?P<collector>[^/]+)/messages/(?P<message>[^/]+)/recipients/bulk$"), "add_recipients"),
+    ("POST", re.compile(r"^/v3/collectors/(?P<collector>[^/]+)/messages/(?P<message>[^/]+)/send$"), "send_message"),
+]
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API. Without Nagle the headers and body of a
+    # response don't wait for a delayed ACK
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+    rate_limit = 0
+    retry_after = 1
+
+    def reply(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self.reply(400, {"error": {"message": "Invalid JSON"}})
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self.reply(401, {"error": {"message": "Missing bearer token"}})
+        with lock:
+            stats["requests"] += 1
+            throttled = self.rate_limit and stats["requests"] % self.rate_limit == 0
+            if throttled:
+                stats["throttled"] += 1
+        if throttled:
+            return self.reply(429, {"error": {"message": "Too many requests"}}, {"Retry-After": str(self.retry_after)})
+        if self.latency:
+            time.sleep(self.latency)
+        for method, pattern, name in ROUTES:
+            match = pattern.match(self.path)
+            if method == "POST" and match:
+                return getattr(self, name)(payload, **match.groupdict())
+        self.reply(404, {"error": {"message": f"No route for {self.path}"}})
+
+    def create_survey(self, payload):
+        survey_id = str(next(ids))
+        self.reply(201, {"id": survey_id, "title": payload.get("title"),
+                         "preview": f"http://{self.headers['Host']}/r/preview/{survey_id}"})
+
+    def create_collector(self, payload, survey):
+        self.reply(201, {"id": str(next(ids)), "survey_id": survey, "type": payload.get("type")})
+
+    def create_message(self, payload, collector):
+        self.reply(201, {"id": str(next(ids)), "type": payload.get("type")})
+
+    def add_recipients(self, payload, collector, message):
+        contacts = payload.get("contacts")
+        if not isinstance(contacts, list) or not contacts:
+            return self.reply(400, {"error": {"message": "No contacts given"}})
+        if len(contacts) > BULK_LIMIT:
+            return self.reply(400, {"error": {"message": f"At most {BULK_LIMIT} contacts per request"}})
+        result = {"succeeded": [], "invalids": [], "existing": [], "bounced": [], "opted_out": []}
+        with lock:
+            added = recipients.setdefault(message, set())
+            for contact in contacts:
+                email = contact.get("email", "") if isinstance(contact, dict) else ""
+                if "@" not in email:
+                    result["invalids"].append({"email": email})
+                elif email.lower() in added:
+                    result["existing"].append({"email": email})
+                else:
+                    added.add(email.lower())
+                    result["succeeded"].append({"id": str(next(ids)), "email": email})
+            stats["recipients"] += len(result["succeeded"])
+            stats["bulk requests"] += 1
+        self.reply(200, result)
+
+    def send_message(self, payload, collector, message):
+        with lock:
+            stats["sent messages"] += 1
+        self.reply(200, {"id": message, "is_scheduled": False})
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(prog="stub_server.py",
+                                     description="Local stub of the SurveyMonkey API endpoints used by sendsurvey.py.")
+    parser.add_argument('--host', default="127.0.0.1", help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on (default: 8080)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response (default: 0)')
+    parser.add_argument('--rate-limit', type=int, default=0, metavar='N', help='Answer every Nth request with 429 (default: never)')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds of a 429 (default: 1)')
+    args = parser.parse_args()
+
+    Handler.latency = args.latency
+    Handler.rate_limit = args.rate_limit
+    Handler.retry_after = args.retry_after
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Stub SurveyMonkey API on http://{args.host}:{server.server_port}/v3", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(", ".join(f"{key}: {value}" for key, value in stats.items()) or "No requests", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()